@@ -1,11 +1,12 @@
 import os
 os.environ["OBJC_DISABLE_INITIALIZE_FORK_SAFETY"] = "YES"
 import json
+import hashlib
 import logging
 from datetime import datetime, timedelta
 
 from airflow import DAG
-from airflow.operators.python import PythonOperator
+from airflow.operators.python import PythonOperator, ShortCircuitOperator
 from datetime import datetime as dt
 
 default_args = {
@@ -19,24 +20,160 @@ default_args = {
 }
 
 PROJECT_DIR = os.getenv("PROJECT_DIR", "/Users/nick/PycharmProjects/ml_ops_exam")
+FINGERPRINT_PATH = os.path.join(PROJECT_DIR, "models", "pipeline_fingerprint.json")
+# Everything that can change the trained model: data digests come from the
+# prepare manifest, these params sections and source files are hashed too.
+FINGERPRINT_PARAMS = ["prepare", "tune", "train", "compact", "evaluate"]
+DRIFT_PSI_THRESHOLD = float(os.getenv("DRIFT_PSI_THRESHOLD", "0.2"))
+FINGERPRINT_SOURCES = ["src/prepare.py", "src/data.py", "src/tune.py", "src/train.py", "src/compact.py",
+                       "src/evaluate.py", "src/forest.py"]
 
 
-def extract_data(**context):
+def _project_path(*parts):
+    return os.path.join(PROJECT_DIR, *parts)
+
+
+def _use_project():
     import sys
-    sys.path.insert(0, PROJECT_DIR)
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    os.chdir(PROJECT_DIR)
+
+
+def extract_data(**context):
+    _use_project()
     
     logging.info("Starting data extraction...")
+    from src.data import MANIFEST_PATH
     from src.prepare import prepare_data
-    train_df, test_df = prepare_data()
+    manifest = prepare_data()
+    
+    logging.info(f"Extracted {manifest['train']['rows']} train, {manifest['test']['rows']} test samples")
+    context["ti"].xcom_push(key="train_samples", value=manifest["train"]["rows"])
+    context["ti"].xcom_push(key="manifest_path", value=_project_path(MANIFEST_PATH))
+    return {"status": "success", "train_samples": manifest["train"]["rows"]}
+
+
+def compute_fingerprint(manifest_path):
+    import yaml
+    
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    with open(_project_path("params.yaml"), "r") as f:
+        params = yaml.safe_load(f)
+    
+    digest = hashlib.sha256()
+    digest.update(json.dumps({name: split["digest"] for name, split in manifest.items()}, sort_keys=True).encode())
+    digest.update(json.dumps({key: params.get(key) for key in FINGERPRINT_PARAMS}, sort_keys=True).encode())
+    for source in FINGERPRINT_SOURCES:
+        with open(_project_path(source), "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def check_drift(**context):
+    # Reads the drift gauges the service exports on /metrics. Without a
+    # SERVICE_URL, if the service is unreachable or has not seen enough
+    # traffic yet, no drift is reported and the fingerprint alone decides.
+    service_url = os.getenv("SERVICE_URL")
+    scores = {}
+    if service_url:
+        import requests
+        from prometheus_client.parser import text_string_to_metric_families
+        
+        try:
+            response = requests.get(f"{service_url}/metrics", timeout=30)
+            response.raise_for_status()
+            for family in text_string_to_metric_families(response.text):
+                if family.name in ("ml_feature_drift_psi", "ml_prediction_drift_psi"):
+                    for sample in family.samples:
+                        scores[sample.labels.get("feature", "predicted_class")] = sample.value
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f"Could not read drift metrics from {service_url}: {e}")
+            scores = {}
     
-    logging.info(f"Extracted {len(train_df)} train, {len(test_df)} test samples")
-    context["ti"].xcom_push(key="train_samples", value=len(train_df))
-    return {"status": "success", "train_samples": len(train_df)}
+    max_psi = max(scores.values(), default=0.0)
+    drift_detected = max_psi >= DRIFT_PSI_THRESHOLD
+    logging.info(f"Drift PSI {scores or 'unavailable'}; max {max_psi:.3f} vs threshold {DRIFT_PSI_THRESHOLD}")
+    context["ti"].xcom_push(key="drift_detected", value=drift_detected)
+    context["ti"].xcom_push(key="max_psi", value=max_psi)
+    return {"drift_detected": drift_detected, "max_psi": max_psi}
+
+
+def check_changes(**context):
+    # ShortCircuit: returning False skips every downstream task when data,
+    # params and code match the last completed run and the service reports
+    # no input drift. Trigger with {"force": true} in the run conf to
+    # retrain anyway.
+    ti = context["ti"]
+    fingerprint = compute_fingerprint(ti.xcom_pull(task_ids="extract_data", key="manifest_path"))
+    ti.xcom_push(key="fingerprint", value=fingerprint)
+    
+    dag_run = context.get("dag_run")
+    if dag_run is not None and (dag_run.conf or {}).get("force"):
+        logging.info("Forced run, ignoring fingerprint")
+        return True
+    if ti.xcom_pull(task_ids="check_drift", key="drift_detected"):
+        logging.info(f"Input drift detected (max PSI {ti.xcom_pull(task_ids='check_drift', key='max_psi'):.3f}), retraining")
+        return True
+    
+    previous = None
+    if os.path.exists(FINGERPRINT_PATH):
+        with open(FINGERPRINT_PATH, "r") as f:
+            previous = json.load(f).get("fingerprint")
+    
+    if previous == fingerprint:
+        logging.info(f"Inputs unchanged (fingerprint {fingerprint[:12]}), skipping retraining")
+        return False
+    logging.info(f"Inputs changed ({(previous or 'none')[:12]} -> {fingerprint[:12]}), retraining")
+    return True
+
+
+def validate_data(**context):
+    _use_project()
+    
+    from src.data import FEATURE_COLS, TRAIN_PATH, TEST_PATH, VALIDATION_PATH, read_table
+    
+    for path in (TRAIN_PATH, VALIDATION_PATH, TEST_PATH):
+        df = read_table(path, columns=FEATURE_COLS + ["target"])
+        if df.empty:
+            raise ValueError(f"{path} is empty")
+        if df.isna().any().any():
+            raise ValueError(f"{path} has missing values: {df.isna().sum()[df.isna().sum() > 0].to_dict()}")
+        classes = sorted(df["target"].unique().tolist())
+        if len(classes) < 3:
+            raise ValueError(f"{path} covers only classes {classes}")
+        logging.info(f"Validated {path}: {len(df)} rows, classes {classes}")
+    return {"status": "valid"}
+
+
+def materialize_online_features(**context):
+    _use_project()
+    
+    from src.data import FEATURES_PATH, read_table
+    from src.features.feast_loader import materialize_features
+    
+    timestamps = read_table(FEATURES_PATH, columns=["event_timestamp"])["event_timestamp"]
+    start_date = timestamps.min().to_pydatetime()
+    end_date = datetime.now()
+    materialize_features(start_date=start_date, end_date=end_date)
+    return {"status": "materialized", "start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+
+
+def tune_model(**context):
+    _use_project()
+    
+    logging.info("Starting hyperparameter search...")
+    from src.tune import tune
+    tuned = tune()
+    
+    logging.info(f"Best params: n_estimators={tuned['n_estimators']}, max_depth={tuned['max_depth']}, "
+                 f"validation F1 {tuned['f1']:.4f}")
+    return tuned
 
 
 def train_model(**context):
-    import sys
-    sys.path.insert(0, PROJECT_DIR)
+    _use_project()
     
     logging.info("Starting model training...")
     from src.train import train_model as run_training
@@ -48,28 +185,47 @@ def train_model(**context):
     return run_info
 
 
+def compact_model(**context):
+    _use_project()
+    
+    logging.info("Starting forest compaction...")
+    from src.compact import compact_model as run_compaction
+    _, metrics = run_compaction()
+    
+    logging.info(f"Compacted {metrics['original']['n_trees']} -> {metrics['compact']['n_trees']} trees, "
+                 f"validation accuracy {metrics['original_accuracy']:.4f} -> {metrics['compact_accuracy']:.4f}")
+    return {"n_trees": metrics["compact"]["n_trees"], "savings": metrics["savings"]}
+
+
 def evaluate_model(**context):
-    import sys
-    sys.path.insert(0, PROJECT_DIR)
+    _use_project()
     
     logging.info("Starting evaluation...")
     from src.evaluate import evaluate_model as run_evaluation
     metrics = run_evaluation()
     
     logging.info(f"Test Accuracy: {metrics['accuracy']:.4f}, Threshold passed: {metrics['threshold_passed']}")
-    context["ti"].xcom_push(key="test_accuracy", value=metrics["accuracy"])
-    context["ti"].xcom_push(key="threshold_passed", value=metrics["threshold_passed"])
+    context["ti"].xcom_push(key="metrics_path", value=_project_path("metrics.json"))
     
     if not metrics["threshold_passed"]:
         logging.warning("Model did not meet accuracy threshold!")
-    return metrics
+    return {"metrics_path": _project_path("metrics.json"), "threshold_passed": metrics["threshold_passed"]}
+
+
+def _read_metrics(ti):
+    metrics_path = ti.xcom_pull(task_ids="evaluate", key="metrics_path")
+    if not metrics_path:
+        return None
+    with open(metrics_path, "r") as f:
+        return json.load(f)
 
 
 def deploy_model(**context):
     ti = context["ti"]
     run_id = ti.xcom_pull(task_ids="train_model", key="mlflow_run_id")
-    test_accuracy = ti.xcom_pull(task_ids="evaluate", key="test_accuracy")
-    threshold_passed = ti.xcom_pull(task_ids="evaluate", key="threshold_passed")
+    metrics = _read_metrics(ti)
+    test_accuracy = metrics["accuracy"]
+    threshold_passed = metrics["threshold_passed"]
     
     if not threshold_passed:
         logging.warning("Skipping deployment: threshold not met")
@@ -79,21 +235,49 @@ def deploy_model(**context):
         "status": "deployed",
         "run_id": run_id,
         "accuracy": test_accuracy,
+        # The artifact evaluate gated; the service serves the same compacted
+        # model (MODEL_PATH=models/compact/model.pkl).
+        "model": metrics.get("model"),
         "deployed_at": datetime.now().isoformat(),
         "version": os.getenv("MODEL_VERSION", "1.0.0"),
     }
     
+    service_url = os.getenv("SERVICE_URL")
+    if service_url:
+        import requests
+        response = requests.post(
+            f"{service_url}/admin/reload",
+            headers={"X-Admin-Token": os.getenv("ADMIN_TOKEN", "")},
+            timeout=120,
+        )
+        response.raise_for_status()
+        deployment_info["service_run_id"] = response.json()["model_run_id"]
+    
     logging.info(f"Deployment complete: {json.dumps(deployment_info)}")
     context["ti"].xcom_push(key="deployment_info", value=deployment_info)
     return deployment_info
 
 
+def record_fingerprint(**context):
+    ti = context["ti"]
+    fingerprint = ti.xcom_pull(task_ids="check_changes", key="fingerprint")
+    os.makedirs(os.path.dirname(FINGERPRINT_PATH), exist_ok=True)
+    with open(FINGERPRINT_PATH, "w") as f:
+        json.dump({
+            "fingerprint": fingerprint,
+            "run_id": ti.xcom_pull(task_ids="train_model", key="mlflow_run_id"),
+            "recorded_at": datetime.now().isoformat()
+        }, f, indent=2)
+    return {"fingerprint": fingerprint}
+
+
 def send_notification(**context):
     ti = context["ti"]
     train_samples = ti.xcom_pull(task_ids="extract_data", key="train_samples")
     run_id = ti.xcom_pull(task_ids="train_model", key="mlflow_run_id")
     train_accuracy = ti.xcom_pull(task_ids="train_model", key="train_accuracy")
-    test_accuracy = ti.xcom_pull(task_ids="evaluate", key="test_accuracy")
+    metrics = _read_metrics(ti)
+    test_accuracy = metrics["accuracy"] if metrics else None
     deployment_info = ti.xcom_pull(task_ids="deploy", key="deployment_info")
     
     message = f"""
@@ -114,16 +298,28 @@ with DAG(
     dag_id="ml_retrain_pipeline",
     default_args=default_args,
     description="ML model retraining pipeline",
-    schedule="@weekly",
+    schedule="@daily",
     start_date=dt(2024, 1, 1),
     catchup=False,
     tags=["mlops", "retraining"],
 ) as dag:
     
     extract_task = PythonOperator(task_id="extract_data", python_callable=extract_data)
+    drift_task = PythonOperator(task_id="check_drift", python_callable=check_drift)
+    check_task = ShortCircuitOperator(task_id="check_changes", python_callable=check_changes)
+    validate_task = PythonOperator(task_id="validate_data", python_callable=validate_data)
+    materialize_task = PythonOperator(task_id="materialize_features", python_callable=materialize_online_features)
+    tune_task = PythonOperator(task_id="tune_model", python_callable=tune_model)
     train_task = PythonOperator(task_id="train_model", python_callable=train_model)
+    compact_task = PythonOperator(task_id="compact_model", python_callable=compact_model)
     evaluate_task = PythonOperator(task_id="evaluate", python_callable=evaluate_model)
     deploy_task = PythonOperator(task_id="deploy", python_callable=deploy_model)
+    record_task = PythonOperator(task_id="record_fingerprint", python_callable=record_fingerprint)
     notify_task = PythonOperator(task_id="notify", python_callable=send_notification)
     
-    extract_task >> train_task >> evaluate_task >> deploy_task >> notify_task
+    # Validation and Feast materialization run alongside training; deploy
+    # waits for all three so the online store is fresh when the new model
+    # starts serving /predict/by-id.
+    [extract_task, drift_task] >> check_task >> [validate_task, materialize_task, tune_task]
+    tune_task >> train_task >> compact_task >> evaluate_task
+    [validate_task, materialize_task, evaluate_task] >> deploy_task >> record_task >> notify_task
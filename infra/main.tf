@@ -94,7 +94,8 @@ resource "local_file" "env_config" {
   filename = "${var.project_root}/.env.terraform"
   content  = <<-EOT
     MODEL_VERSION=${var.model_version}
-    MODEL_PATH=${var.bucket_path}/models/model.pkl
+    MODEL_PATH=${var.bucket_path}/models/compact/model.pkl
+    FLAT_FOREST_PATH=${var.bucket_path}/models/compact/forest
     BUCKET_PATH=${var.bucket_path}
     MLFLOW_TRACKING_URI=${var.mlflow_tracking_uri}
     MLFLOW_EXPERIMENT_NAME=${var.mlflow_experiment_name}
@@ -0,0 +1,184 @@
+import os
+import glob
+import json
+import fnmatch
+import time
+import shutil
+import resource
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data import FEATURE_COLS
+from src.forest import file_digest
+
+_worker_model = None
+
+
+def load_params():
+    with open("params.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+
+def list_input_files(path):
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True))
+    return [path]
+
+
+def check_output_dir(path):
+    # Only a previous run's output is ever replaced: anything besides
+    # part-*.parquet files (in partition_by subdirectories) means the path
+    # points somewhere it should not.
+    if not os.path.exists(path):
+        return
+    if not os.path.isdir(path):
+        raise ValueError(f"Output path {path} exists and is not a directory")
+    for root, _, files in os.walk(path):
+        for name in files:
+            if not fnmatch.fnmatch(name, "part-*.parquet"):
+                raise ValueError(f"Refusing to replace {path}: {os.path.join(root, name)} is not a batch prediction part")
+
+
+def plan_tasks(files, rows_per_task):
+    # A task is a run of consecutive row groups of one file, so a worker
+    # reads only its own byte ranges and never re-reads the footer of a file
+    # it does not score. Small row groups are merged up to rows_per_task.
+    tasks = []
+    for path in files:
+        metadata = pq.ParquetFile(path).metadata
+        group, rows = [], 0
+        for i in range(metadata.num_row_groups):
+            group.append(i)
+            rows += metadata.row_group(i).num_rows
+            if rows >= rows_per_task:
+                tasks.append((path, group, rows))
+                group, rows = [], 0
+        if group:
+            tasks.append((path, group, rows))
+    return tasks
+
+
+def _init_worker(model_path):
+    global _worker_model
+    import joblib
+    
+    _worker_model = joblib.load(model_path)
+    _worker_model.set_params(n_jobs=None)
+
+
+def score_task(task_id, path, row_groups, key_columns, params):
+    start = time.perf_counter()
+    classes = _worker_model.classes_
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    # Only the feature and key columns are decoded from each row group.
+    columns = [c for c in key_columns if c in parquet_file.schema_arrow.names] + FEATURE_COLS
+    rows = 0
+    
+    batches = parquet_file.iter_batches(batch_size=params["batch_rows"], row_groups=row_groups, columns=columns)
+    for batch_id, batch in enumerate(batches):
+        features = batch.select(FEATURE_COLS).to_pandas()
+        proba = _worker_model.predict_proba(features)
+        
+        arrays = [batch.column(c) for c in columns if c not in FEATURE_COLS]
+        names = [c for c in columns if c not in FEATURE_COLS]
+        arrays.append(pa.array(classes.take(proba.argmax(axis=1)).astype(np.int8)))
+        names.append("predicted_class")
+        if params["write_probabilities"]:
+            for j, label in enumerate(classes):
+                arrays.append(pa.array(proba[:, j].astype(np.float32)))
+                names.append(f"proba_{label}")
+        
+        pq.write_to_dataset(
+            pa.Table.from_arrays(arrays, names=names),
+            params["output_dir"],
+            partition_cols=params.get("partition_by") or None,
+            basename_template=f"part-{task_id:05d}-{batch_id:05d}-{{i}}.parquet"
+        )
+        rows += batch.num_rows
+    
+    return {
+        "pid": os.getpid(),
+        "rows": rows,
+        "seconds": time.perf_counter() - start,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def batch_predict():
+    params = load_params()["batch_predict"]
+    params["input"] = os.getenv("BATCH_PREDICT_INPUT") or params["input"]
+    params["output_dir"] = os.getenv("BATCH_PREDICT_OUTPUT") or params["output_dir"]
+    model_path = os.getenv("BATCH_PREDICT_MODEL_PATH", "models/model.pkl")
+    
+    tasks = plan_tasks(list_input_files(params["input"]), params["rows_per_task"])
+    workers = max(1, min(params.get("workers") or os.cpu_count() or 1, len(tasks)))
+    key_columns = params["key_columns"]
+    
+    # Parts are written to a sibling directory and swapped in once every task
+    # has finished: a rerun never mixes with a previous run's parts, and a
+    # failed run leaves the previous output in place.
+    output_dir = params["output_dir"]
+    check_output_dir(output_dir)
+    tmp_dir = f"{output_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    worker_params = dict(params, output_dir=tmp_dir)
+    
+    print(f"Scoring {sum(rows for _, _, rows in tasks)} rows in {len(tasks)} tasks on {workers} workers")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        futures = [
+            pool.submit(score_task, task_id, path, row_groups, key_columns, worker_params)
+            for task_id, (path, row_groups, _) in enumerate(tasks)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    
+    old_dir = f"{output_dir.rstrip(os.sep)}.old-{os.getpid()}"
+    if os.path.exists(output_dir):
+        os.rename(output_dir, old_dir)
+    os.rename(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    
+    per_worker = {}
+    for result in results:
+        worker = per_worker.setdefault(result["pid"], {"tasks": 0, "rows": 0, "seconds": 0.0, "max_rss_mb": 0.0})
+        worker["tasks"] += 1
+        worker["rows"] += result["rows"]
+        worker["seconds"] += result["seconds"]
+        worker["max_rss_mb"] = max(worker["max_rss_mb"], result["max_rss_mb"])
+    
+    rows = sum(result["rows"] for result in results)
+    metrics = {
+        "model_digest": file_digest(model_path),
+        "input": params["input"],
+        "output_dir": params["output_dir"],
+        "workers": workers,
+        "tasks": len(tasks),
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed > 0 else 0.0,
+        "per_worker": [
+            dict(worker, rows_per_second=worker["rows"] / worker["seconds"] if worker["seconds"] > 0 else 0.0)
+            for worker in per_worker.values()
+        ]
+    }
+    
+    with open("batch_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+    
+    print(f"\nBatch prediction complete!")
+    print(f"  - {rows} rows in {elapsed:.2f}s ({metrics['rows_per_second']:.0f} rows/sec)")
+    for worker in metrics["per_worker"]:
+        print(f"  - Worker: {worker['tasks']} tasks, {worker['rows']} rows, "
+              f"{worker['rows_per_second']:.0f} rows/sec, peak RSS {worker['max_rss_mb']:.0f} MB")
+    print(f"  - Predictions written to: {params['output_dir']}")
+    
+    return metrics
+
+
+if __name__ == "__main__":
+    batch_predict()
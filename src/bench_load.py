@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import asyncio
+import resource
+import yaml
+import numpy as np
+
+from src.data import FEATURE_COLS, TRAIN_PATH, read_table
+
+
+def load_params():
+    with open("params.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+
+def synthetic_payloads(rows, count, seed, return_probabilities):
+    # Rows are drawn uniformly inside the training range of every feature, so
+    # they look like iris inputs but (almost) never repeat.
+    train_df = read_table(TRAIN_PATH, columns=FEATURE_COLS)
+    low = train_df.min().to_numpy()
+    high = train_df.max().to_numpy()
+    rng = np.random.default_rng(seed)
+    return [
+        {"features": rng.uniform(low, high, size=(rows, len(FEATURE_COLS))).round(2).tolist(),
+         "return_probabilities": return_probabilities}
+        for _ in range(count)
+    ]
+
+
+def replay_payloads(path, count):
+    # One JSON request body per line, replayed in order (and cycled if the
+    # log is shorter than the number of requests).
+    with open(path, "r") as f:
+        bodies = [json.loads(line) for line in f if line.strip()]
+    return [bodies[i % len(bodies)] for i in range(count)]
+
+
+def summarize(latencies, rows, errors, elapsed, cpu_seconds):
+    latencies = np.asarray(latencies) * 1000
+    completed = len(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if completed else (None, None, None)
+    return {
+        "requests": completed + errors,
+        "errors": errors,
+        "rps": completed / elapsed if elapsed > 0 else 0.0,
+        "rows_per_second": rows / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": float(p50) if completed else None,
+        "p95_ms": float(p95) if completed else None,
+        "p99_ms": float(p99) if completed else None,
+        "cpu_us_per_prediction": cpu_seconds / rows * 1e6 if cpu_seconds is not None and rows else None
+    }
+
+
+async def _send(client, endpoint, payload):
+    response = await client.post(endpoint, json=payload)
+    response.raise_for_status()
+    return len(payload.get("features", payload.get("iris_ids", [])))
+
+
+async def run_closed_loop(client, endpoint, payloads, concurrency):
+    # Fixed concurrency: each worker sends its next request as soon as the
+    # previous one returns.
+    queue = iter(payloads)
+    latencies, counters = [], {"rows": 0, "errors": 0}
+
+    async def worker():
+        for payload in queue:
+            start = time.perf_counter()
+            try:
+                counters["rows"] += await _send(client, endpoint, payload)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                counters["errors"] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, counters["rows"], counters["errors"]
+
+
+async def run_open_loop(client, endpoint, payloads, arrival_rate, seed):
+    # Poisson arrivals at a fixed rate regardless of how fast responses come
+    # back. Latency is measured from the scheduled send time, so a stalled
+    # server shows up as queueing delay instead of fewer requests.
+    rng = np.random.default_rng(seed)
+    offsets = np.cumsum(rng.exponential(1 / arrival_rate, size=len(payloads)))
+    latencies, counters = [], {"rows": 0, "errors": 0}
+    start = time.perf_counter()
+
+    async def fire(offset, payload):
+        scheduled = start + offset
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        try:
+            counters["rows"] += await _send(client, endpoint, payload)
+            latencies.append(time.perf_counter() - scheduled)
+        except Exception:
+            counters["errors"] += 1
+
+    await asyncio.gather(*(fire(offset, payload) for offset, payload in zip(offsets, payloads)))
+    return latencies, counters["rows"], counters["errors"]
+
+
+async def run_scenario(client, params, payloads, cpu_clock):
+    endpoint = params["endpoint"]
+    for payload in payloads[:params["warmup"]]:
+        await _send(client, endpoint, payload)
+    payloads = payloads[params["warmup"]:]
+
+    cpu_start = cpu_clock() if cpu_clock else None
+    start = time.perf_counter()
+    if params.get("arrival_rate"):
+        latencies, rows, errors = await run_open_loop(client, endpoint, payloads, params["arrival_rate"], params["seed"])
+    else:
+        latencies, rows, errors = await run_closed_loop(client, endpoint, payloads, params["concurrency"])
+    elapsed = time.perf_counter() - start
+    cpu_seconds = cpu_clock() - cpu_start if cpu_clock else None
+    return summarize(latencies, rows, errors, elapsed, cpu_seconds)
+
+
+async def benchmark(params, scenarios):
+    import httpx
+
+    url = os.getenv("BENCH_SERVICE_URL") or params.get("url")
+    if url:
+        # Over HTTP the server runs in another process, so its CPU time is
+        # not visible here and cpu_us_per_prediction is reported as null.
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            return "http", {name: await run_scenario(client, params, payloads, None) for name, payloads in scenarios}
+
+    # In-process: requests go through the full FastAPI/ASGI stack without a
+    # socket, and process CPU time covers both the client and the service.
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+    if not params.get("prediction_cache", False):
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+    import src.service as service
+
+    await service.startup_event()
+    try:
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return "inprocess", {
+                name: await run_scenario(client, params, payloads, time.process_time)
+                for name, payloads in scenarios
+            }
+    finally:
+        await service.shutdown_event()
+
+
+def benchmark_load():
+    params = load_params()["bench_load"]
+    count = params["requests"] + params["warmup"]
+
+    if params.get("request_log"):
+        scenarios = [("replay", replay_payloads(params["request_log"], count))]
+    else:
+        scenarios = [
+            (f"rows_{rows}", synthetic_payloads(rows, count, params["seed"], params["return_probabilities"]))
+            for rows in params["rows_per_request"]
+        ]
+
+    transport, results = asyncio.run(benchmark(params, scenarios))
+
+    metrics = {
+        "transport": transport,
+        "endpoint": params["endpoint"],
+        "load": f"open_loop@{params['arrival_rate']}rps" if params.get("arrival_rate") else f"closed_loop@{params['concurrency']}",
+        "scenarios": results,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+    with open("load_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+
+    print(f"\nLoad benchmark ({transport}, {metrics['load']}, {params['endpoint']}):")
+    for name, result in results.items():
+        cpu = f", {result['cpu_us_per_prediction']:.1f} us CPU/prediction" if result["cpu_us_per_prediction"] is not None else ""
+        # Percentiles are None when every request in the scenario failed.
+        p50, p95, p99 = (f"{result[key]:.2f} ms" if result[key] is not None else "n/a"
+                         for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"  - {name}: {result['rps']:.0f} rps, p50 {p50}, p95 {p95}, p99 {p99}, {result['errors']} errors{cpu}")
+
+    return metrics
+
+
+if __name__ == "__main__":
+    benchmark_load()
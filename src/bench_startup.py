@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import resource
+import statistics
+import subprocess
+import yaml
+
+
+def load_params():
+    with open("params.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+
+def measure_startup():
+    import asyncio
+    
+    start = time.perf_counter()
+    import src.service as service
+    import_time = time.perf_counter() - start
+    
+    async def cold_start():
+        start = time.perf_counter()
+        await service.startup_event()
+        load_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        await service._predict(b'{"features": [[5.1, 3.5, 1.4, 0.2]]}')
+        first_request = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        await service._predict(b'{"features": [[6.7, 3.0, 5.2, 2.3]]}')
+        second_request = time.perf_counter() - start
+        
+        await service.shutdown_event()
+        return load_time, first_request, second_request
+    
+    load_time, first_request, second_request = asyncio.run(cold_start())
+    return {
+        "import_seconds": import_time,
+        "load_seconds": load_time,
+        "first_request_seconds": first_request,
+        "second_request_seconds": second_request,
+        "sklearn_imported": "sklearn" in sys.modules,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def benchmark_startup():
+    params = load_params()["bench_startup"]
+    env = dict(os.environ, MODEL_WATCH_INTERVAL="0", PREDICTION_CACHE_SIZE="0")
+    
+    runs = []
+    for _ in range(params["runs"]):
+        result = subprocess.run(
+            [sys.executable, "-m", "src.bench_startup", "--child"],
+            env=env, capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    
+    metrics = {"runs": len(runs), "sklearn_imported": any(r["sklearn_imported"] for r in runs)}
+    for key in ("import_seconds", "load_seconds", "first_request_seconds", "second_request_seconds", "max_rss_mb"):
+        values = [r[key] for r in runs]
+        metrics[key] = {"median": statistics.median(values), "max": max(values)}
+    metrics["cold_start_seconds"] = statistics.median(
+        r["import_seconds"] + r["load_seconds"] + r["first_request_seconds"] for r in runs
+    )
+    
+    with open("startup_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+    
+    print(f"\nStartup benchmark ({len(runs)} cold starts, median):")
+    print(f"  - Import: {metrics['import_seconds']['median'] * 1000:.1f} ms")
+    print(f"  - Model load: {metrics['load_seconds']['median'] * 1000:.1f} ms")
+    print(f"  - First request: {metrics['first_request_seconds']['median'] * 1000:.2f} ms")
+    print(f"  - Cold start total: {metrics['cold_start_seconds'] * 1000:.1f} ms")
+    print(f"  - sklearn imported: {metrics['sklearn_imported']}")
+    
+    return metrics
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        print(json.dumps(measure_startup()))
+    else:
+        benchmark_startup()
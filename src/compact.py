@@ -0,0 +1,250 @@
+import os
+import copy
+import json
+import time
+import statistics
+import yaml
+import joblib
+import numpy as np
+import mlflow
+import mlflow.sklearn
+from dotenv import load_dotenv
+
+from src.data import FEATURE_COLS, VALIDATION_PATH, read_table
+from src.forest import file_digest, flatten_forest, save_flat_forest
+from src.tune import measure_latency
+
+load_dotenv()
+
+COMPACT_DIR = "models/compact"
+COMPACT_MODEL_PATH = os.path.join(COMPACT_DIR, "model.pkl")
+COMPACT_FOREST_PATH = os.path.join(COMPACT_DIR, "forest")
+
+
+def load_params():
+    with open("params.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+
+def tree_probas(model, X):
+    # Per-tree class probabilities on the validation rows, shape
+    # (n_trees, n_rows, n_classes); the forest's predict_proba is their mean.
+    return np.stack([estimator.predict_proba(X) for estimator in model.estimators_])
+
+
+def select_trees(probas, y, target_accuracy, min_trees):
+    # Greedy forward selection: every step adds the tree that gives the
+    # subset the best validation accuracy (ties go to the lower log loss) and
+    # stops at the first subset of at least min_trees trees that reaches the
+    # target. If no subset does, every tree ends up selected.
+    n_trees, n_rows, _ = probas.shape
+    rows = np.arange(n_rows)
+    total = np.zeros(probas.shape[1:])
+    remaining = list(range(n_trees))
+    selected = []
+    
+    while remaining:
+        candidates = (total + probas[remaining]) / (len(selected) + 1)
+        accuracy = (candidates.argmax(axis=-1) == y).mean(axis=-1)
+        log_loss = -np.log(np.clip(candidates[:, rows, y], 1e-15, None)).mean(axis=-1)
+        best = np.lexsort((log_loss, -accuracy))[0]
+        
+        total += probas[remaining[best]]
+        selected.append(remaining.pop(best))
+        if len(selected) >= min_trees and accuracy[best] >= target_accuracy:
+            break
+    return selected
+
+
+def prune_tree(estimator):
+    # Collapses every subtree whose leaves all predict the same class into a
+    # single leaf holding that node's own class distribution. The tree's
+    # predicted class is unchanged for every input (a weighted mix of
+    # distributions that share an argmax keeps it); only the probabilities it
+    # contributes to the forest average shift. Dropped nodes are removed and
+    # the rest renumbered, so the tree actually gets smaller.
+    tree = estimator.tree_
+    left, right = tree.children_left, tree.children_right
+    value = tree.value[:, 0, :]
+    
+    # Children are always stored after their parent, so one reverse pass sees
+    # both children before the node itself. -1 marks a mixed subtree.
+    leaf_class = np.full(tree.node_count, -1)
+    for node in range(tree.node_count - 1, -1, -1):
+        if left[node] == -1:
+            leaf_class[node] = value[node].argmax()
+        elif leaf_class[left[node]] == leaf_class[right[node]]:
+            leaf_class[node] = leaf_class[left[node]]
+    
+    order, depths = [], []
+    stack = [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        order.append(node)
+        depths.append(depth)
+        if left[node] != -1 and leaf_class[node] == -1:
+            stack.append((right[node], depth + 1))
+            stack.append((left[node], depth + 1))
+    
+    if len(order) == tree.node_count:
+        return 0
+    
+    order = np.asarray(order)
+    new_index = np.full(tree.node_count, -1)
+    new_index[order] = np.arange(len(order))
+    is_leaf = (left[order] == -1) | (leaf_class[order] != -1)
+    
+    state = tree.__getstate__()
+    nodes = state["nodes"][order].copy()
+    nodes["left_child"] = np.where(is_leaf, -1, new_index[nodes["left_child"]])
+    nodes["right_child"] = np.where(is_leaf, -1, new_index[nodes["right_child"]])
+    nodes["feature"] = np.where(is_leaf, -2, nodes["feature"])
+    nodes["threshold"] = np.where(is_leaf, -2.0, nodes["threshold"])
+    
+    removed = tree.node_count - len(order)
+    tree.__setstate__(dict(
+        state,
+        node_count=len(order),
+        max_depth=max(depths),
+        nodes=np.ascontiguousarray(nodes),
+        values=np.ascontiguousarray(state["values"][order])
+    ))
+    return removed
+
+
+def build_compact_model(model, selected, prune):
+    compact = copy.deepcopy(model)
+    compact.estimators_ = [compact.estimators_[i] for i in selected]
+    compact.set_params(n_estimators=len(selected))
+    removed = sum(prune_tree(estimator) for estimator in compact.estimators_) if prune else 0
+    return compact, removed
+
+
+def node_count(model):
+    return int(sum(estimator.tree_.node_count for estimator in model.estimators_))
+
+
+def batch_latency(model, X, repeats):
+    # sklearn predict_proba on the whole validation split: the path serving
+    # takes for batches above FLAT_FOREST_MAX_ROWS.
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(X)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def profile(model, model_path, X, params):
+    forest = flatten_forest(model)
+    return {
+        "n_trees": len(model.estimators_),
+        "n_nodes": node_count(model),
+        "model_bytes": os.path.getsize(model_path),
+        "flat_forest_bytes": int(sum(getattr(forest, name).nbytes
+                                     for name in ("feature", "threshold", "left", "right", "value"))),
+        "single_row_ms": measure_latency(model, X[:1].to_numpy(), params["latency_repeats"]),
+        "batch_ms": batch_latency(model, X, params["batch_latency_repeats"])
+    }
+
+
+def compact_model():
+    params = load_params()["compact"]
+    
+    mlflow_uri = os.getenv("MLFLOW_TRACKING_URI", "./mlruns")
+    mlflow.set_tracking_uri(mlflow_uri)
+    
+    # The full forest written by train; MODEL_PATH is the service's (compacted) model.
+    model_path = os.getenv("TRAIN_MODEL_PATH", "models/model.pkl")
+    model = joblib.load(model_path)
+    classes = model.classes_
+    
+    validation_df = read_table(VALIDATION_PATH, columns=FEATURE_COLS + ["target"])
+    if validation_df.empty:
+        raise ValueError(f"{VALIDATION_PATH} is empty: set prepare.validation_size > 0 to compact the forest")
+    X_val = validation_df[FEATURE_COLS]
+    y_val = np.searchsorted(classes, validation_df["target"].to_numpy())
+    
+    # The individual trees were fit on plain arrays, so they are scored on one.
+    probas = tree_probas(model, X_val.to_numpy(np.float32))
+    original_accuracy = float((probas.mean(axis=0).argmax(axis=1) == y_val).mean())
+    target_accuracy = original_accuracy - params["max_accuracy_drop"]
+    
+    selected = select_trees(probas, y_val, target_accuracy, params["min_trees"])
+    compact, nodes_removed = build_compact_model(model, selected, params["prune"])
+    compact_accuracy = float((compact.predict_proba(X_val).argmax(axis=1) == y_val).mean())
+    if nodes_removed and compact_accuracy < target_accuracy:
+        # Pruning keeps each tree's vote but not its probabilities, which can
+        # flip a close forest average; fall back to the unpruned subset.
+        print(f"Pruning dropped validation accuracy to {compact_accuracy:.4f}, keeping the unpruned trees")
+        compact, nodes_removed = build_compact_model(model, selected, prune=False)
+        compact_accuracy = float((compact.predict_proba(X_val).argmax(axis=1) == y_val).mean())
+    
+    os.makedirs(COMPACT_DIR, exist_ok=True)
+    joblib.dump(compact, COMPACT_MODEL_PATH)
+    save_flat_forest(flatten_forest(compact), COMPACT_FOREST_PATH, source_digest=file_digest(COMPACT_MODEL_PATH))
+    
+    original_profile = profile(model, model_path, X_val, params)
+    compact_profile = profile(compact, COMPACT_MODEL_PATH, X_val, params)
+    savings = {
+        name: 1 - compact_profile[name] / original_profile[name] if original_profile[name] else 0.0
+        for name in ("n_trees", "n_nodes", "model_bytes", "flat_forest_bytes", "single_row_ms", "batch_ms")
+    }
+    metrics = {
+        "validation_rows": len(y_val),
+        "original_accuracy": original_accuracy,
+        "compact_accuracy": compact_accuracy,
+        "accuracy_drop": original_accuracy - compact_accuracy,
+        "max_accuracy_drop": params["max_accuracy_drop"],
+        "selected_trees": [int(i) for i in selected],
+        "nodes_pruned": int(nodes_removed),
+        "original": original_profile,
+        "compact": compact_profile,
+        "savings": savings
+    }
+    
+    run_info_path = "models/run_info.json"
+    run_info = {}
+    if os.path.exists(run_info_path):
+        with open(run_info_path, "r") as f:
+            run_info = json.load(f)
+    
+    if run_info.get("run_id"):
+        with mlflow.start_run(run_id=run_info["run_id"]):
+            # Tags rather than params: compaction can be rerun on the same
+            # training run with different settings, and params are immutable.
+            mlflow.set_tags({"compact_max_accuracy_drop": params["max_accuracy_drop"],
+                             "compact_min_trees": params["min_trees"], "compact_prune": params["prune"]})
+            mlflow.log_metrics({
+                "validation_accuracy": original_accuracy,
+                "compact_validation_accuracy": compact_accuracy,
+                "compact_n_trees": compact_profile["n_trees"],
+                "compact_n_nodes": compact_profile["n_nodes"],
+                **{f"compact_{name}_savings": value for name, value in savings.items()}
+            })
+            mlflow.log_dict(metrics, "compaction.json")
+            # The original model is already logged under "model" by train.
+            mlflow.sklearn.log_model(compact, "compact_model")
+    
+    # Serving looks for run_info.json next to the model it loads.
+    with open(os.path.join(COMPACT_DIR, "run_info.json"), "w") as f:
+        json.dump(dict(run_info, compact=True, source_model=model_path), f, indent=2)
+    
+    with open("compaction_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+    
+    print(f"\nCompaction complete!")
+    print(f"  - Validation accuracy: {original_accuracy:.4f} -> {compact_accuracy:.4f} "
+          f"(max drop {params['max_accuracy_drop']}, {len(y_val)} rows)")
+    print(f"  - Trees: {original_profile['n_trees']} -> {compact_profile['n_trees']}, "
+          f"nodes: {original_profile['n_nodes']} -> {compact_profile['n_nodes']} ({nodes_removed} pruned)")
+    print(f"  - Model size: {original_profile['model_bytes'] / 1024:.0f} KB -> {compact_profile['model_bytes'] / 1024:.0f} KB")
+    print(f"  - Single-row latency: {original_profile['single_row_ms']:.3f} ms -> {compact_profile['single_row_ms']:.3f} ms")
+    print(f"  - Batch latency ({len(y_val)} rows): {original_profile['batch_ms']:.3f} ms -> {compact_profile['batch_ms']:.3f} ms")
+    print(f"  - Compact model saved to: {COMPACT_MODEL_PATH}")
+    
+    return compact, metrics
+
+
+if __name__ == "__main__":
+    compact_model()
@@ -0,0 +1,92 @@
+import hashlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FEATURE_COLS = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+
+SCHEMA = pa.schema(
+    [(name, pa.float32()) for name in FEATURE_COLS]
+    + [
+        ("target", pa.int8()),
+        ("iris_id", pa.int32()),
+        ("event_timestamp", pa.timestamp("us")),
+    ]
+)
+
+RAW_PATH = "data/raw/iris.parquet"
+TRAIN_PATH = "data/processed/train.parquet"
+TEST_PATH = "data/processed/test.parquet"
+VALIDATION_PATH = "data/processed/validation.parquet"
+FEATURES_PATH = "data/processed/features.parquet"
+MANIFEST_PATH = "data/processed/manifest.json"
+REFERENCE_PROFILE_PATH = "data/processed/reference_profile.json"
+
+
+def _schema(columns) -> pa.Schema:
+    return pa.schema([SCHEMA.field(name) for name in columns])
+
+
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    table = pa.Table.from_pandas(df, schema=_schema(df.columns), preserve_index=False)
+    # Drop the pandas metadata blob so identical rows always produce
+    # identical bytes, whatever index the frame happened to carry.
+    return table.replace_schema_metadata(None)
+
+
+def write_table(df: pd.DataFrame, path: str) -> None:
+    pq.write_table(_to_arrow(df), path)
+
+
+class ChunkedTableWriter:
+    # Appends frames to one Parquet file, one row group per chunk, so a
+    # split can be written without ever holding it in memory. The digest
+    # matches frame_digest() of all chunks concatenated.
+
+    def __init__(self, path: str, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+        self._writer = pq.ParquetWriter(path, _schema(self.columns))
+        self._digest = hashlib.sha256()
+
+    def write(self, df: pd.DataFrame) -> None:
+        if len(df) == 0:
+            return
+        df = df[self.columns]
+        self._writer.write_table(_to_arrow(df))
+        self._digest.update(_row_hashes(df))
+        self.rows += len(df)
+
+    def close(self) -> str:
+        self._writer.close()
+        return self._digest.hexdigest()
+
+
+def read_table(path: str, columns=None) -> pd.DataFrame:
+    # Only the requested column chunks are decoded; the file itself is
+    # memory-mapped rather than read into a buffer first.
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def iter_frames(path: str, columns=None, batch_size: int = 65536):
+    # Streams a Parquet file in record batches so callers never hold more
+    # than batch_size rows of it at once.
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def cast_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype({
+        field.name: field.type.to_pandas_dtype() for field in SCHEMA if field.name in df.columns
+    })
+
+
+def _row_hashes(df: pd.DataFrame) -> bytes:
+    return pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    return hashlib.sha256(_row_hashes(df)).hexdigest()
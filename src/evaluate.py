@@ -2,46 +2,158 @@ import os
 import json
 import yaml
 import joblib
-import pandas as pd
+import numpy as np
 import mlflow
-from sklearn.metrics import (
-    accuracy_score, f1_score, precision_score,
-    recall_score, classification_report, confusion_matrix
-)
+from sklearn.metrics import classification_report
 from dotenv import load_dotenv
 
+from src.data import FEATURE_COLS, TEST_PATH, iter_frames
+from src.forest import load_flat_forest
+
 load_dotenv()
 
+METRICS = ["accuracy", "f1_score", "precision", "recall"]
+
 
 def load_params():
     with open("params.yaml", "r") as f:
         return yaml.safe_load(f)
 
 
+def confusion_metrics(cm):
+    # Weighted-average metrics from confusion matrices of shape (..., K, K)
+    # (rows = true class), matching sklearn's average="weighted" with
+    # zero_division=0. Works on one matrix or a stack of bootstrap ones.
+    cm = cm.astype(np.float64)
+    tp = np.diagonal(cm, axis1=-2, axis2=-1)
+    support = cm.sum(axis=-1)
+    predicted = cm.sum(axis=-2)
+    total = support.sum(axis=-1)
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, tp / predicted, 0.0)
+        recall = np.where(support > 0, tp / support, 0.0)
+        f1 = np.where(support + predicted > 0, 2 * tp / (support + predicted), 0.0)
+        weights = support / total[..., None]
+    
+    return {
+        "accuracy": tp.sum(axis=-1) / total,
+        "f1_score": (f1 * weights).sum(axis=-1),
+        "precision": (precision * weights).sum(axis=-1),
+        "recall": (recall * weights).sum(axis=-1)
+    }
+
+
+def bootstrap_metrics(y_true, y_pred, n_classes, params):
+    # Each resample is a row of an index matrix into the cached label and
+    # prediction arrays, so nothing is re-predicted. Resamples are processed
+    # in blocks of at most bootstrap_block_elements indices to bound memory,
+    # and every block is reduced to confusion matrices with one bincount.
+    n = len(y_true)
+    n_resamples = params["bootstrap_resamples"]
+    codes = y_true.astype(np.int64) * n_classes + y_pred
+    cells = n_classes * n_classes
+    rng = np.random.default_rng(params["bootstrap_seed"])
+    block = max(1, min(n_resamples, params["bootstrap_block_elements"] // max(n, 1)))
+    
+    samples = {name: [] for name in METRICS}
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        idx = rng.integers(0, n, size=(size, n))
+        flat = (codes[idx] + (np.arange(size) * cells)[:, None]).ravel()
+        cm = np.bincount(flat, minlength=size * cells).reshape(size, n_classes, n_classes)
+        for name, values in confusion_metrics(cm).items():
+            samples[name].append(values)
+    
+    alpha = (1 - params["ci_level"]) / 2
+    return {
+        name: [float(v) for v in np.quantile(np.concatenate(values), [alpha, 1 - alpha])]
+        for name, values in samples.items()
+    }
+
+
+def slice_edges(params):
+    return {feature: np.asarray(edges, dtype=np.float32) for feature, edges in (params.get("slices") or {}).items()}
+
+
+def slice_names(feature, edges):
+    bounds = [None] + [f"{e:g}" for e in edges] + [None]
+    names = []
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        if low is None:
+            names.append(f"{feature}<{high}")
+        elif high is None:
+            names.append(f"{feature}>={low}")
+        else:
+            names.append(f"{low}<={feature}<{high}")
+    return names
+
+
 def evaluate_model():
     params = load_params()["evaluate"]
     
     mlflow_uri = os.getenv("MLFLOW_TRACKING_URI", "./mlruns")
     mlflow.set_tracking_uri(mlflow_uri)
     
-    model_path = os.getenv("MODEL_PATH", "models/model.pkl")
+    # The gate applies to the model that will be served: the compacted forest
+    # by default, the full one with evaluate.model: original. MODEL_PATH and
+    # FLAT_FOREST_PATH belong to the service and are deliberately not read
+    # here; EVALUATE_MODEL_PATH / EVALUATE_FOREST_PATH override explicitly.
+    compact = params.get("model", "original") == "compact"
+    model_path = os.getenv("EVALUATE_MODEL_PATH") or ("models/compact/model.pkl" if compact else "models/model.pkl")
     model = joblib.load(model_path)
+    classes = model.classes_
+    n_classes = len(classes)
     
-    test_df = pd.read_csv("data/processed/test.csv")
+    forest_path = os.getenv("EVALUATE_FOREST_PATH") or ("models/compact/forest" if compact else "models/forest")
+    flat_forest = load_flat_forest(forest_path) if os.path.exists(forest_path) else None
+    flat_forest_max_diff = 0.0 if flat_forest is not None else None
     
-    feature_cols = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
-    X_test = test_df[feature_cols]
-    y_test = test_df["target"]
+    # The test set is streamed in chunks; only the int8 label/prediction
+    # codes are kept for the bootstrap, and slice confusion matrices are
+    # accumulated as we go.
+    edges = slice_edges(params)
+    slice_cms = {feature: np.zeros((len(e) + 1, n_classes, n_classes), dtype=np.int64) for feature, e in edges.items()}
+    y_true_parts, y_pred_parts = [], []
     
-    y_pred = model.predict(X_test)
+    for chunk in iter_frames(TEST_PATH, columns=FEATURE_COLS + ["target"], batch_size=params["chunk_rows"]):
+        X_chunk = chunk[FEATURE_COLS]
+        proba = model.predict_proba(X_chunk)
+        y_true = np.searchsorted(classes, chunk["target"].to_numpy()).astype(np.int8)
+        y_pred = proba.argmax(axis=1).astype(np.int8)
+        y_true_parts.append(y_true)
+        y_pred_parts.append(y_pred)
+        
+        if flat_forest is not None:
+            flat_forest_max_diff = max(flat_forest_max_diff, float(np.abs(flat_forest.predict_proba(X_chunk) - proba).max()))
+        
+        codes = y_true.astype(np.int64) * n_classes + y_pred
+        for feature, e in edges.items():
+            bins = np.digitize(chunk[feature].to_numpy(), e)
+            slice_cms[feature] += np.bincount(
+                bins * n_classes * n_classes + codes, minlength=slice_cms[feature].size
+            ).reshape(slice_cms[feature].shape)
     
-    accuracy = accuracy_score(y_test, y_pred)
-    f1 = f1_score(y_test, y_pred, average="weighted")
-    precision = precision_score(y_test, y_pred, average="weighted")
-    recall = recall_score(y_test, y_pred, average="weighted")
+    y_true = np.concatenate(y_true_parts)
+    y_pred = np.concatenate(y_pred_parts)
+    cm = np.bincount(y_true.astype(np.int64) * n_classes + y_pred, minlength=n_classes * n_classes).reshape(n_classes, n_classes)
     
-    report = classification_report(y_test, y_pred, output_dict=True)
-    cm = confusion_matrix(y_test, y_pred)
+    point = {name: float(value) for name, value in confusion_metrics(cm).items()}
+    accuracy, f1, precision, recall = (point[name] for name in METRICS)
+    confidence_intervals = bootstrap_metrics(y_true, y_pred, n_classes, params)
+    
+    slice_metrics = {}
+    for feature, e in edges.items():
+        for name, slice_cm in zip(slice_names(feature, e), slice_cms[feature]):
+            n_rows = int(slice_cm.sum())
+            if n_rows:
+                values = confusion_metrics(slice_cm)
+                slice_metrics[name] = {"rows": n_rows, "accuracy": float(values["accuracy"]), "f1_score": float(values["f1_score"])}
+    
+    flat_forest_parity = flat_forest_max_diff is None or flat_forest_max_diff <= params["flat_forest_tolerance"]
+    gate_value = confidence_intervals["accuracy"][0] if params.get("gate", "point") == "ci_lower" else accuracy
+    
+    report = classification_report(classes[y_true], classes[y_pred], output_dict=True)
     
     run_info_path = "models/run_info.json"
     run_id = None
@@ -58,29 +170,47 @@ def evaluate_model():
                 "test_precision": precision,
                 "test_recall": recall
             })
+            mlflow.log_metrics({
+                f"test_{name}_ci_{bound}": value
+                for name, interval in confidence_intervals.items()
+                for bound, value in zip(("lower", "upper"), interval)
+            })
             mlflow.log_dict(report, "classification_report.json")
             mlflow.log_dict({"confusion_matrix": cm.tolist()}, "confusion_matrix.json")
+            mlflow.log_dict(slice_metrics, "slice_metrics.json")
+            mlflow.set_tag("evaluated_model", model_path)
     
     metrics = {
+        "model": model_path,
+        "n_trees": len(model.estimators_),
         "accuracy": accuracy,
         "f1_score": f1,
         "precision": precision,
         "recall": recall,
-        "threshold_passed": accuracy >= params["threshold"]
+        "confidence_intervals": confidence_intervals,
+        "ci_level": params["ci_level"],
+        "slices": slice_metrics,
+        "flat_forest_max_diff": flat_forest_max_diff,
+        "gate": params.get("gate", "point"),
+        "threshold_passed": bool(gate_value >= params["threshold"] and flat_forest_parity)
     }
     
     with open("metrics.json", "w") as f:
         json.dump(metrics, f, indent=2)
     
-    print(f"\nEvaluation Results:")
-    print(f"  - Test Accuracy: {accuracy:.4f}")
-    print(f"  - Test F1 Score: {f1:.4f}")
-    print(f"  - Test Precision: {precision:.4f}")
-    print(f"  - Test Recall: {recall:.4f}")
-    print(f"\nThreshold: {params['threshold']}")
+    print(f"\nEvaluation Results for {model_path} ({len(y_true)} rows, {params['ci_level']:.0%} bootstrap CI, "
+          f"{params['bootstrap_resamples']} resamples):")
+    for label, name in (("Accuracy", "accuracy"), ("F1 Score", "f1_score"), ("Precision", "precision"), ("Recall", "recall")):
+        lower, upper = confidence_intervals[name]
+        print(f"  - Test {label}: {point[name]:.4f} [{lower:.4f}, {upper:.4f}]")
+    if flat_forest_max_diff is not None:
+        print(f"  - Flat forest max |proba diff|: {flat_forest_max_diff:.2e}")
+    for name, values in slice_metrics.items():
+        print(f"  - Slice {name}: accuracy {values['accuracy']:.4f} ({values['rows']} rows)")
+    print(f"\nThreshold: {params['threshold']} (gate: {metrics['gate']} = {gate_value:.4f})")
     print(f"Threshold Passed: {'Yes' if metrics['threshold_passed'] else 'No'}")
     print(f"\nClassification Report:")
-    print(classification_report(y_test, y_pred))
+    print(classification_report(classes[y_true], classes[y_pred]))
     
     return metrics
 
@@ -1,25 +1,116 @@
 import os
+import time
+import threading
 import subprocess
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from typing import List, Optional
 
+FEATURE_VIEW = "iris_features"
+FEATURE_NAMES = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+FEATURE_REFS = [f"{FEATURE_VIEW}:{name}" for name in FEATURE_NAMES]
+
+REGISTRY_REFRESH_SECONDS = float(os.getenv("FEAST_REGISTRY_REFRESH_SECONDS", "60"))
+ONLINE_CACHE_SIZE = int(os.getenv("FEAST_ONLINE_CACHE_SIZE", "100000"))
+ONLINE_CACHE_TTL = float(os.getenv("FEAST_ONLINE_CACHE_TTL", "300"))
+ONLINE_BATCH_SIZE = int(os.getenv("FEAST_ONLINE_BATCH_SIZE", "1000"))
+
+_store = None
+_store_refreshed_at = 0.0
+_store_lock = threading.Lock()
+
 
 def get_feast_store():
-    from feast import FeatureStore
-    return FeatureStore(repo_path=os.getenv("FEAST_REPO_PATH", "./feast"))
+    # One FeatureStore per process: feature_store.yaml and the registry are
+    # parsed once, and the registry is re-read every REGISTRY_REFRESH_SECONDS
+    # so `feast apply` changes are still picked up.
+    global _store, _store_refreshed_at
+    
+    with _store_lock:
+        now = time.monotonic()
+        if _store is None:
+            from feast import FeatureStore
+            _store = FeatureStore(repo_path=os.getenv("FEAST_REPO_PATH", "./feast"))
+            _store_refreshed_at = now
+        elif REGISTRY_REFRESH_SECONDS > 0 and now - _store_refreshed_at >= REGISTRY_REFRESH_SECONDS:
+            _store.refresh_registry()
+            _store_refreshed_at = now
+        return _store
+
+
+class OnlineFeatureCache:
+    # Read-through LRU of online feature rows per entity id. Entries live for
+    # FEAST_ONLINE_CACHE_TTL (five minutes by default) and never longer than
+    # the FeatureView ttl, so a cached row is never served after Feast itself
+    # would drop it, and a materialization in another process (the retrain
+    # DAG) shows up within minutes even if nobody clears the cache.
+    
+    def __init__(self, max_entries: int, hits_metric=None, misses_metric=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = None
+        self.hits = 0
+        self.misses = 0
+        self.hits_metric = hits_metric
+        self.misses_metric = misses_metric
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def configure_ttl(self, store):
+        if self.ttl_seconds is not None:
+            return
+        ttl = store.get_feature_view(FEATURE_VIEW).ttl
+        ttl_seconds = ttl.total_seconds() if ttl else float("inf")
+        self.ttl_seconds = min(ttl_seconds, ONLINE_CACHE_TTL)
+    
+    def lookup(self, entity_ids: np.ndarray):
+        rows = np.full((len(entity_ids), len(FEATURE_NAMES)), np.nan, dtype=np.float32)
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for i, entity_id in enumerate(entity_ids.tolist()):
+                entry = self._entries.get(entity_id)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(entity_id)
+                    rows[i] = entry[1]
+                else:
+                    missing.append(i)
+            self.hits += len(entity_ids) - len(missing)
+            self.misses += len(missing)
+        if self.hits_metric is not None:
+            self.hits_metric.inc(len(entity_ids) - len(missing))
+            self.misses_metric.inc(len(missing))
+        return rows, np.asarray(missing, dtype=np.intp)
+    
+    def store(self, entity_ids: np.ndarray, rows: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for entity_id, row in zip(entity_ids.tolist(), rows):
+                # Unknown ids come back as NaN; don't pin them in the cache so
+                # a later materialization is seen immediately.
+                if np.isnan(row).any():
+                    continue
+                self._entries[entity_id] = (expires_at, row)
+                self._entries.move_to_end(entity_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+online_cache = OnlineFeatureCache(ONLINE_CACHE_SIZE)
 
 
 def get_historical_features(entity_df: pd.DataFrame, feature_refs: Optional[List[str]] = None) -> pd.DataFrame:
     store = get_feast_store()
     
     if feature_refs is None:
-        feature_refs = [
-            "iris_features:sepal_length",
-            "iris_features:sepal_width",
-            "iris_features:petal_length",
-            "iris_features:petal_width"
-        ]
+        feature_refs = FEATURE_REFS
     
     if "event_timestamp" not in entity_df.columns:
         entity_df["event_timestamp"] = datetime.now()
@@ -27,19 +118,43 @@ def get_historical_features(entity_df: pd.DataFrame, feature_refs: Optional[List
     return store.get_historical_features(entity_df=entity_df, features=feature_refs).to_df()
 
 
-def get_online_features(entity_ids: List[int]) -> pd.DataFrame:
+def _fetch_online(store, entity_ids: np.ndarray) -> np.ndarray:
+    rows = np.empty((len(entity_ids), len(FEATURE_NAMES)), dtype=np.float32)
+    for start in range(0, len(entity_ids), ONLINE_BATCH_SIZE):
+        batch = entity_ids[start:start + ONLINE_BATCH_SIZE]
+        # Columnar entity rows: one list for the whole batch instead of a
+        # dict per id, answered by a single read against the SQLite store.
+        response = store.get_online_features(
+            features=FEATURE_REFS,
+            entity_rows={"iris_id": batch.tolist()}
+        ).to_dict()
+        rows[start:start + len(batch)] = np.array(
+            [[np.nan if v is None else v for v in response[name]] for name in FEATURE_NAMES],
+            dtype=np.float32
+        ).T
+    return rows
+
+
+def get_online_feature_matrix(entity_ids) -> np.ndarray:
+    # Returns a (len(entity_ids), 4) float32 matrix in request order; ids the
+    # online store doesn't know yield NaN rows. Duplicate ids are looked up
+    # once.
     store = get_feast_store()
-    entity_rows = [{"iris_id": eid} for eid in entity_ids]
+    online_cache.configure_ttl(store)
     
-    return store.get_online_features(
-        features=[
-            "iris_features:sepal_length",
-            "iris_features:sepal_width",
-            "iris_features:petal_length",
-            "iris_features:petal_width"
-        ],
-        entity_rows=entity_rows
-    ).to_df()
+    unique_ids, inverse = np.unique(np.asarray(entity_ids, dtype=np.int64), return_inverse=True)
+    rows, missing = online_cache.lookup(unique_ids)
+    if len(missing):
+        fetched = _fetch_online(store, unique_ids[missing])
+        rows[missing] = fetched
+        online_cache.store(unique_ids[missing], fetched)
+    return rows[inverse]
+
+
+def get_online_features(entity_ids: List[int]) -> pd.DataFrame:
+    df = pd.DataFrame(get_online_feature_matrix(entity_ids), columns=FEATURE_NAMES)
+    df.insert(0, "iris_id", entity_ids)
+    return df
 
 
 def apply_feast_features():
@@ -56,4 +171,5 @@ def apply_feast_features():
 def materialize_features(start_date: datetime, end_date: datetime):
     store = get_feast_store()
     store.materialize(start_date=start_date, end_date=end_date)
+    online_cache.clear()
     print(f"Features materialized: {start_date} to {end_date}")
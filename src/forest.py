@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FlatForest:
+    # All trees of a fitted RandomForestClassifier packed into shared node
+    # arrays. Leaves point to themselves, so every row can be advanced
+    # through every tree in lock-step for max_depth steps without branching.
+
+    def __init__(self, feature, threshold, left, right, value, roots, classes, max_depth,
+                 source_digest: Optional[str] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+        self.source_digest = source_digest
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.value[node].mean(axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+
+def flatten_forest(model) -> FlatForest:
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        value = tree.value[:, 0, :]
+        values.append(value / value.sum(axis=1, keepdims=True))
+        roots.append(offset)
+
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    return FlatForest(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.intp),
+        right=np.concatenate(rights).astype(np.intp),
+        value=np.concatenate(values).astype(np.float64),
+        roots=np.asarray(roots, dtype=np.intp),
+        classes=np.asarray(model.classes_),
+        max_depth=max_depth
+    )
+
+
+FOREST_ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "classes")
+
+
+def save_flat_forest(forest: FlatForest, path: str, source_digest: Optional[str] = None):
+    # One .npy per array plus meta.json, written to a sibling directory and
+    # renamed into place so readers never see a half-written bundle.
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    arrays = {
+        "feature": forest.feature,
+        "threshold": forest.threshold,
+        "left": forest.left,
+        "right": forest.right,
+        "value": forest.value,
+        "roots": forest.roots,
+        "classes": forest.classes_,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"max_depth": forest.max_depth, "source_digest": source_digest or forest.source_digest}, f, indent=2)
+
+    old_path = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_flat_forest(path: str, mmap_mode: Optional[str] = "r") -> FlatForest:
+    # Memory-mapped arrays are backed by the OS page cache, so every worker
+    # process that loads the same bundle shares one physical copy.
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    arrays = {
+        name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        for name in FOREST_ARRAYS
+    }
+
+    return FlatForest(
+        feature=arrays["feature"],
+        threshold=arrays["threshold"],
+        left=arrays["left"],
+        right=arrays["right"],
+        value=arrays["value"],
+        roots=arrays["roots"],
+        classes=arrays["classes"],
+        max_depth=meta["max_depth"],
+        source_digest=meta.get("source_digest")
+    )
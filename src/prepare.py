@@ -1,9 +1,22 @@
 import os
+import json
+import time
+import resource
 import yaml
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from sklearn.datasets import load_iris
 from sklearn.model_selection import train_test_split
-from datetime import datetime
+
+from src.data import (
+    FEATURE_COLS, RAW_PATH, TRAIN_PATH, TEST_PATH, VALIDATION_PATH, FEATURES_PATH, MANIFEST_PATH, REFERENCE_PROFILE_PATH,
+    ChunkedTableWriter, cast_frame, frame_digest, iter_frames, write_table
+)
+
+SPLIT_COLS = FEATURE_COLS + ["target", "iris_id", "event_timestamp"]
+FEATURE_STORE_COLS = ["iris_id"] + FEATURE_COLS + ["event_timestamp"]
+HASH_BUCKETS = 10000
 
 
 def load_params():
@@ -11,22 +24,98 @@ def load_params():
         return yaml.safe_load(f)
 
 
-def prepare_data():
-    params = load_params()["prepare"]
-    
+def load_iris_frame(params):
     iris = load_iris()
-    df = pd.DataFrame(
-        data=iris.data,
-        columns=["sepal_length", "sepal_width", "petal_length", "petal_width"]
-    )
-    df["target"] = iris.target
-    df["iris_id"] = range(len(df))
-    df["event_timestamp"] = datetime.now()
+    df = pd.DataFrame(data=iris.data.astype(np.float32), columns=FEATURE_COLS)
+    df["target"] = iris.target.astype(np.int8)
+    df["iris_id"] = np.arange(len(df), dtype=np.int32)
+    # A fixed event time keeps the outputs byte-identical across runs, so DVC
+    # and the retrain DAG only see a change when the data itself changes.
+    df["event_timestamp"] = pd.Timestamp(params["event_timestamp"])
+    return df
+
+
+def iter_source_chunks(params):
+    source = params.get("source")
+    chunk_rows = params["chunk_rows"]
     
-    os.makedirs("data/processed", exist_ok=True)
-    os.makedirs("data/raw", exist_ok=True)
+    if source is None:
+        df = load_iris_frame(params)
+        chunks = (df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows))
+    elif source.endswith(".parquet"):
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows))
+    else:
+        chunks = pd.read_csv(source, chunksize=chunk_rows)
     
-    df.to_csv("data/raw/iris.csv", index=False)
+    for chunk in chunks:
+        if "event_timestamp" not in chunk:
+            chunk = chunk.assign(event_timestamp=pd.Timestamp(params["event_timestamp"]))
+        yield cast_frame(chunk[SPLIT_COLS])
+
+
+def hash_split(ids, test_size, validation_size, random_state):
+    # Each entity lands in the same split on every run and in every chunk, so
+    # no global shuffle is needed. Because the hash ignores the label, every
+    # class is split in the test_size/validation_size ratios in expectation.
+    hash_key = f"{random_state:016d}"[-16:]
+    buckets = pd.util.hash_array(np.asarray(ids, dtype=np.int64), hash_key=hash_key) % HASH_BUCKETS
+    is_test = buckets < test_size * HASH_BUCKETS
+    is_validation = ~is_test & (buckets < (test_size + validation_size) * HASH_BUCKETS)
+    return is_test, is_validation
+
+
+def reference_edges(df, n_bins):
+    # Decile-style bin edges from the training data; the serving drift
+    # monitor bins live traffic on the same edges.
+    quantiles = np.linspace(0, 1, n_bins + 1)[1:-1]
+    return {
+        feature: np.unique(np.quantile(df[feature].to_numpy(np.float64), quantiles)).tolist()
+        for feature in FEATURE_COLS
+    }
+
+
+def profile_counts(df, edges):
+    counts = {
+        feature: np.bincount(
+            np.searchsorted(edges[feature], df[feature].to_numpy(), side="right"), minlength=len(edges[feature]) + 1
+        )
+        for feature in FEATURE_COLS
+    }
+    classes = {int(label): int(count) for label, count in df["target"].value_counts().items()}
+    return counts, classes
+
+
+def sample_rows(sample, part, max_rows):
+    # Bottom-k sample on a hash of iris_id: a uniform sample of the whole
+    # split that does not depend on how the source is sorted or chunked, so
+    # sorted sources (by class, by time) still get representative edges.
+    keys = pd.util.hash_array(part["iris_id"].to_numpy(np.int64), hash_key="reference-sample")
+    candidates = part[FEATURE_COLS].assign(sample_key=keys)
+    if sample is not None:
+        candidates = pd.concat([sample, candidates], ignore_index=True)
+    if len(candidates) > max_rows:
+        candidates = candidates.nsmallest(max_rows, "sample_key")
+    return candidates
+
+
+def write_reference_profile(edges, counts, class_counts):
+    rows = int(sum(class_counts.values()))
+    profile = {
+        "rows": rows,
+        "features": {
+            feature: {"edges": edges[feature], "proportions": (counts[feature] / max(rows, 1)).tolist()}
+            for feature in FEATURE_COLS
+        },
+        "classes": {str(label): count / max(rows, 1) for label, count in sorted(class_counts.items())}
+    }
+    with open(REFERENCE_PROFILE_PATH, "w") as f:
+        json.dump(profile, f, indent=2)
+
+
+def prepare_in_memory(params):
+    df = load_iris_frame(params)
+    
+    write_table(df, RAW_PATH)
     
     train_df, test_df = train_test_split(
         df,
@@ -35,19 +124,106 @@ def prepare_data():
         stratify=df["target"]
     )
     
-    train_df.to_csv("data/processed/train.csv", index=False)
-    test_df.to_csv("data/processed/test.csv", index=False)
+    # The validation split is carved out of the training rows and is only
+    # used by compaction, so the test set stays untouched until evaluate.
+    validation_size = params.get("validation_size", 0)
+    if validation_size > 0:
+        train_df, validation_df = train_test_split(
+            train_df,
+            test_size=validation_size / (1 - params["test_size"]),
+            random_state=params["random_state"],
+            stratify=train_df["target"]
+        )
+    else:
+        validation_df = train_df.iloc[:0]
+    
+    write_table(train_df, TRAIN_PATH)
+    write_table(test_df, TEST_PATH)
+    write_table(validation_df, VALIDATION_PATH)
+    write_table(df[FEATURE_STORE_COLS], FEATURES_PATH)
+    
+    edges = reference_edges(train_df, params["profile_bins"])
+    write_reference_profile(edges, *profile_counts(train_df, edges))
+    
+    return {
+        name: {"rows": len(split), "digest": frame_digest(split)}
+        for name, split in (("raw", df), ("train", train_df), ("test", test_df), ("validation", validation_df))
+    }
+
+
+def prepare_streaming(params):
+    writers = {
+        "raw": ChunkedTableWriter(RAW_PATH, SPLIT_COLS),
+        "train": ChunkedTableWriter(TRAIN_PATH, SPLIT_COLS),
+        "test": ChunkedTableWriter(TEST_PATH, SPLIT_COLS),
+        "validation": ChunkedTableWriter(VALIDATION_PATH, SPLIT_COLS),
+    }
+    features_writer = ChunkedTableWriter(FEATURES_PATH, FEATURE_STORE_COLS)
+    class_counts = {"train": {}, "test": {}, "validation": {}}
+    # The full split is never in memory: profile edges come from a bounded
+    # sample of every chunk's training rows, and the counts on those edges
+    # from a second pass over the written train split.
+    sample = None
+    
+    start = time.perf_counter()
+    for chunk in iter_source_chunks(params):
+        is_test, is_validation = hash_split(
+            chunk["iris_id"], params["test_size"], params.get("validation_size", 0), params["random_state"]
+        )
+        is_train = ~(is_test | is_validation)
+        writers["raw"].write(chunk)
+        features_writer.write(chunk)
+        for name, part in (("train", chunk[is_train]), ("test", chunk[is_test]), ("validation", chunk[is_validation])):
+            writers[name].write(part)
+            for label, count in part["target"].value_counts().items():
+                class_counts[name][int(label)] = class_counts[name].get(int(label), 0) + int(count)
+        
+        sample = sample_rows(sample, chunk[is_train], params["profile_sample_rows"])
+    
+    features_writer.close()
+    manifest = {name: {"rows": writer.rows, "digest": writer.close()} for name, writer in writers.items()}
+    
+    if manifest["train"]["rows"]:
+        edges = reference_edges(sample, params["profile_bins"])
+        profile = {feature: 0 for feature in FEATURE_COLS}
+        for frame in iter_frames(TRAIN_PATH, columns=FEATURE_COLS + ["target"], batch_size=params["chunk_rows"]):
+            counts, _ = profile_counts(frame, edges)
+            profile = {feature: profile[feature] + counts[feature] for feature in FEATURE_COLS}
+        write_reference_profile(edges, profile, class_counts["train"])
+    elapsed = time.perf_counter() - start
+    
+    rows = manifest["raw"]["rows"]
+    print(f"Streamed {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed > 0 else 0:.0f} rows/sec, "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB)")
+    for label in sorted(class_counts["train"].keys() | class_counts["test"].keys() | class_counts["validation"].keys()):
+        n_train, n_test, n_validation = (class_counts[name].get(label, 0) for name in ("train", "test", "validation"))
+        print(f"  - Class {label}: {n_train} train / {n_validation} validation / {n_test} test "
+              f"({n_test / (n_train + n_test + n_validation):.1%} test)")
+    
+    return manifest
+
+
+def prepare_data():
+    params = load_params()["prepare"]
+    
+    os.makedirs("data/processed", exist_ok=True)
+    os.makedirs("data/raw", exist_ok=True)
+    
+    if params.get("mode", "memory") == "streaming":
+        manifest = prepare_streaming(params)
+    else:
+        manifest = prepare_in_memory(params)
     
-    features_df = df[["iris_id", "sepal_length", "sepal_width", 
-                      "petal_length", "petal_width", "event_timestamp"]]
-    features_df.to_parquet("data/processed/features.parquet", index=False)
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2)
     
     print(f"Data preparation complete!")
-    print(f"  - Raw data: data/raw/iris.csv ({len(df)} samples)")
-    print(f"  - Train set: data/processed/train.csv ({len(train_df)} samples)")
-    print(f"  - Test set: data/processed/test.csv ({len(test_df)} samples)")
+    print(f"  - Raw data: {RAW_PATH} ({manifest['raw']['rows']} samples)")
+    print(f"  - Train set: {TRAIN_PATH} ({manifest['train']['rows']} samples)")
+    print(f"  - Validation set: {VALIDATION_PATH} ({manifest['validation']['rows']} samples)")
+    print(f"  - Test set: {TEST_PATH} ({manifest['test']['rows']} samples)")
     
-    return train_df, test_df
+    return manifest
 
 
 if __name__ == "__main__":
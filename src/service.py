@@ -1,16 +1,31 @@
 import os
+import sys
+import hmac
+import json
 import time
-import joblib
+import asyncio
 import numpy as np
 from typing import List, Optional
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.responses import Response
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from dotenv import load_dotenv
 
+from src.serving.batching import MicroBatcher
+from src.serving.cache import PredictionCache
+from src.serving.decoding import CONTENT_TYPES, decode_features, media_type
+from src.serving.drift import DriftMonitor
+from src.serving.executor import InferenceExecutor
+from src.serving.model import ServingModel, load_serving_model
+from src.serving.registry import ModelVersionCache
+from src.serving.shadow import ShadowScorer
+from src.serving.streaming import (
+    NDJSON_CONTENT_TYPE, STREAM_CONTENT_TYPES, DuplexStreamingResponse, iter_feature_chunks
+)
+
 load_dotenv()
 
 app = FastAPI(
@@ -18,19 +33,89 @@ app = FastAPI(
     version=os.getenv("MODEL_VERSION", "1.0.0")
 )
 
-REQUEST_COUNT = Counter("ml_requests_total", "Total requests", ["endpoint", "method", "status"])
-REQUEST_LATENCY = Histogram("ml_request_latency_seconds", "Request latency", ["endpoint"],
+REQUEST_COUNT = Counter("ml_requests_total", "Total requests", ["endpoint", "method", "status", "model_version"])
+REQUEST_LATENCY = Histogram("ml_request_latency_seconds", "Request latency", ["endpoint", "model_version"],
                             buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0])
-PREDICTION_COUNT = Counter("ml_predictions_total", "Predictions by class", ["predicted_class"])
-MODEL_INFO = Gauge("ml_model_info", "Model info", ["version", "model_type"])
+PREDICTION_COUNT = Counter("ml_predictions_total", "Predictions by class", ["predicted_class", "model_version"])
+MODEL_INFO = Gauge("ml_model_info", "Model info", ["version", "model_type", "run_id"])
+MODEL_RELOADS = Counter("ml_model_reloads_total", "Model reload attempts", ["status"])
+BATCH_QUEUE_DEPTH = Histogram("ml_batch_queue_depth", "Requests left waiting when a micro-batch is dispatched",
+                              buckets=[0, 1, 2, 4, 8, 16, 32, 64, 128, 256])
+BATCH_SIZE = Histogram("ml_batch_size_rows", "Rows per micro-batch inference call",
+                       buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+INFERENCE_QUEUE_WAIT = Histogram("ml_inference_queue_wait_seconds", "Time inference waits for a pool worker",
+                                 buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0])
+CACHE_HITS = Counter("ml_prediction_cache_hits_total", "Feature rows served from the prediction cache")
+CACHE_MISSES = Counter("ml_prediction_cache_misses_total", "Feature rows scored by the model after a cache miss")
+CACHE_EVICTIONS = Counter("ml_prediction_cache_evictions_total", "Prediction cache evictions", ["reason"])
+CACHE_SIZE = Gauge("ml_prediction_cache_size", "Entries in the prediction cache")
+STAGE_LATENCY = Histogram("ml_stage_latency_seconds", "Per-stage request latency", ["endpoint", "stage"],
+                          buckets=[0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0])
+REQUEST_ROWS = Histogram("ml_request_rows", "Feature rows per request", ["endpoint"],
+                         buckets=[1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000])
+STREAM_ROWS = Counter("ml_stream_rows_total", "Rows scored through /predict/stream")
+STREAM_THROUGHPUT = Gauge("ml_stream_rows_per_second", "Throughput of the last completed /predict/stream request")
+SHADOW_INFO = Gauge("ml_shadow_model_info", "Shadow model info", ["run_id"])
+SHADOW_ROWS = Counter("ml_shadow_rows_total", "Rows scored by the shadow model")
+SHADOW_AGREEMENTS = Counter("ml_shadow_agreements_total", "Shadow rows whose predicted class matches the primary model")
+SHADOW_LATENCY = Histogram("ml_shadow_inference_latency_seconds", "Shadow model inference latency per sampled request",
+                           buckets=[0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0])
+SHADOW_DROPPED = Counter("ml_shadow_dropped_total", "Sampled requests dropped because the shadow queue was full")
+SHADOW_ERRORS = Counter("ml_shadow_errors_total", "Shadow scoring failures")
+FEATURE_DRIFT_PSI = Gauge("ml_feature_drift_psi", "PSI of recent inputs against the reference profile", ["feature"])
+FEATURE_DRIFT_KS = Gauge("ml_feature_drift_ks", "Binned KS statistic of recent inputs against the reference profile",
+                         ["feature"])
+PREDICTION_DRIFT_PSI = Gauge("ml_prediction_drift_psi", "PSI of the recent predicted-class mix against training labels")
+DRIFT_WINDOW_ROWS = Gauge("ml_drift_window_rows", "Decayed number of rows behind the drift scores")
+MODEL_VERSION_LOADS = Counter("ml_model_version_loads_total", "Registry model versions loaded on demand", ["status"])
+MODEL_VERSION_EVICTIONS = Counter("ml_model_version_evictions_total", "Registry model versions evicted from the LRU")
+MODEL_VERSIONS_LOADED = Gauge("ml_model_versions_loaded", "Registry model versions held in memory")
+MODEL_VERSIONS_BYTES = Gauge("ml_model_versions_bytes", "Approximate memory of the registry model versions held")
+FEATURE_CACHE_HITS = Counter("ml_feature_cache_hits_total", "Entity ids served from the online feature cache")
+FEATURE_CACHE_MISSES = Counter("ml_feature_cache_misses_total", "Entity ids fetched from the Feast online store")
+FEATURE_LOOKUP_MISSING = Counter("ml_feature_lookup_missing_total", "Entity ids unknown to the online store")
 
-model = None
-model_loaded_at = None
+model: Optional[ServingModel] = None
+batcher = None
+executor = None
+model_watcher = None
+shadow = None
+drift_monitor = None
+model_versions = None
+reload_lock = asyncio.Lock()
 IRIS_CLASSES = ["setosa", "versicolor", "virginica"]
+IRIS_CLASS_NAMES = np.array(IRIS_CLASSES)
+PREDICT_ENDPOINTS = ["/predict", "/predict/batch", "/predict/stream", "/predict/by-id"]
+STAGES = ["resolve", "decode", "inference", "encode"]
+# model_version label of requests served by the MODEL_PATH model.
+DEFAULT_VERSION = "default"
+
+PREDICTION_COUNTERS = {DEFAULT_VERSION: [PREDICTION_COUNT.labels(predicted_class=c, model_version=DEFAULT_VERSION)
+                                         for c in IRIS_CLASSES]}
+STAGE_TIMERS = {(e, s): STAGE_LATENCY.labels(endpoint=e, stage=s) for e in PREDICT_ENDPOINTS for s in STAGES}
+STAGE_TIMERS[("/predict/by-id", "lookup")] = STAGE_LATENCY.labels(endpoint="/predict/by-id", stage="lookup")
+ROWS_OBSERVERS = {e: REQUEST_ROWS.labels(endpoint=e) for e in PREDICT_ENDPOINTS}
+# Model input columns, in order. Not imported from src.data or feast_loader:
+# both pull in pandas, which the service otherwise never loads.
+FEATURE_NAMES = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+FLAT_FOREST_MAX_ROWS = int(os.getenv("FLAT_FOREST_MAX_ROWS", "512"))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1024"))
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+
+prediction_cache = PredictionCache(
+    max_entries=PREDICTION_CACHE_SIZE,
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", "300")),
+    decimals=int(os.environ["PREDICTION_CACHE_DECIMALS"]) if os.getenv("PREDICTION_CACHE_DECIMALS") else None,
+    hits_metric=CACHE_HITS,
+    misses_metric=CACHE_MISSES,
+    evictions_metric=CACHE_EVICTIONS,
+    size_metric=CACHE_SIZE
+) if PREDICTION_CACHE_SIZE > 0 else None
 
 
 class PredictRequest(BaseModel):
     features: List[List[float]] = Field(..., example=[[5.1, 3.5, 1.4, 0.2]])
+    return_probabilities: bool = True
 
 
 class PredictResponse(BaseModel):
@@ -39,89 +124,588 @@ class PredictResponse(BaseModel):
     probabilities: Optional[List[List[float]]] = None
 
 
+class PredictByIdRequest(BaseModel):
+    iris_ids: List[int] = Field(..., example=[0, 42, 101])
+    return_probabilities: bool = True
+
+
+class PredictByIdResponse(PredictResponse):
+    iris_ids: List[int]
+    missing_ids: Optional[List[int]] = None
+
+
 class HealthResponse(BaseModel):
     status: str
     model_version: str
     model_loaded: bool
     model_loaded_at: Optional[str]
+    model_run_id: Optional[str] = None
     timestamp: str
 
 
+class ReloadResponse(BaseModel):
+    reloaded: bool
+    model_run_id: Optional[str]
+    model_loaded_at: Optional[str]
+
+
+# The compacted model is the one evaluate gates, so it is what gets served.
+def _model_path() -> str:
+    return os.getenv("MODEL_PATH", "models/compact/model.pkl")
+
+
+def _forest_path() -> Optional[str]:
+    if os.getenv("INFERENCE_ENGINE", "flat") != "flat":
+        return None
+    return os.getenv("FLAT_FOREST_PATH", "models/compact/forest")
+
+
+def _load_candidate() -> ServingModel:
+    return load_serving_model(
+        _model_path(), _forest_path(), FLAT_FOREST_MAX_ROWS,
+        eager=os.getenv("MODEL_LOAD_MODE", "lazy") == "eager"
+    )
+
+
+def _artifact_stamp():
+    stamp = []
+    for path in (_model_path(), _forest_path()):
+        try:
+            stat = os.stat(path) if path else None
+            stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size) if stat else None)
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _activate(candidate: ServingModel):
+    global model
+    model = candidate
+    if prediction_cache is not None:
+        prediction_cache.bind(candidate.model_id)
+    MODEL_INFO.clear()
+    MODEL_INFO.labels(
+        version=os.getenv("MODEL_VERSION", "1.0.0"),
+        model_type="RandomForestClassifier",
+        run_id=candidate.run_id or "unknown"
+    ).set(1)
+
+
 def load_model():
-    global model, model_loaded_at
-    model_path = os.getenv("MODEL_PATH", "models/model.pkl")
-    
-    if not os.path.exists(model_path):
-        raise FileNotFoundError(f"Model not found at {model_path}")
-    
-    model = joblib.load(model_path)
-    model_loaded_at = datetime.now().isoformat()
-    MODEL_INFO.labels(version=os.getenv("MODEL_VERSION", "1.0.0"), model_type="RandomForestClassifier").set(1)
+    candidate = _load_candidate()
+    _activate(candidate)
     return model
 
 
+async def reload_model(force: bool = False) -> bool:
+    async with reload_lock:
+        try:
+            candidate = await asyncio.to_thread(_load_candidate)
+            await asyncio.to_thread(candidate.warm_up)
+        except Exception as e:
+            MODEL_RELOADS.labels(status="failed").inc()
+            print(f"Warning: model reload failed: {e}")
+            raise
+        
+        if not force and model is not None and candidate.model_id == model.model_id and \
+                (candidate.forest is None) == (model.forest is None):
+            MODEL_RELOADS.labels(status="unchanged").inc()
+            return False
+        
+        if executor is not None:
+            executor.reload(_model_path(), _forest_path(), FLAT_FOREST_MAX_ROWS, candidate.model_id)
+        _activate(candidate)
+        MODEL_RELOADS.labels(status="reloaded").inc()
+        print(f"Model reloaded at {candidate.loaded_at}, run_id={candidate.run_id}")
+        return True
+
+
+async def _watch_model(interval: float, stamp: tuple):
+    while True:
+        await asyncio.sleep(interval)
+        current = _artifact_stamp()
+        if current == stamp or current[0] is None:
+            continue
+        try:
+            await reload_model()
+            stamp = current
+        except Exception:
+            pass
+
+
+async def _run_model(serving_model: ServingModel, features: np.ndarray) -> np.ndarray:
+    if batcher is not None:
+        return await batcher.submit(serving_model, features)
+    return await executor.run(serving_model, features)
+
+
+async def _predict_proba(serving_model: ServingModel, features: np.ndarray) -> np.ndarray:
+    if prediction_cache is None or prediction_cache.model_id != serving_model.model_id:
+        return await _run_model(serving_model, features)
+    
+    keys = prediction_cache.keys(features)
+    proba, missing = prediction_cache.lookup(keys, n_classes=len(serving_model.classes_))
+    if len(missing):
+        fresh = await _run_model(serving_model, features[missing])
+        proba[missing] = fresh
+        prediction_cache.store([keys[i] for i in missing], fresh, model_id=serving_model.model_id)
+    return proba
+
+
 @app.on_event("startup")
 async def startup_event():
+    global batcher, executor, model_watcher, shadow, drift_monitor, model_versions
+    stamp = _artifact_stamp()
     try:
         load_model()
-        print(f"Model loaded at {model_loaded_at}")
+        print(f"Model loaded at {model.loaded_at}")
     except FileNotFoundError as e:
         print(f"Warning: {e}")
 
+    executor = InferenceExecutor(
+        backend=os.getenv("INFERENCE_BACKEND", "inline"),
+        workers=int(os.getenv("INFERENCE_WORKERS", "0")) or None,
+        queue_wait_metric=INFERENCE_QUEUE_WAIT
+    )
+    executor.start(_model_path(), _forest_path(), FLAT_FOREST_MAX_ROWS, model.model_id if model else None)
+
+    if os.getenv("BATCHING_ENABLED", "false").lower() == "true":
+        batcher = MicroBatcher(
+            executor.run,
+            max_batch_rows=int(os.getenv("BATCH_MAX_ROWS", "256")),
+            max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", "2")),
+            max_in_flight=executor.workers if executor.backend != "inline" else 1,
+            queue_depth_metric=BATCH_QUEUE_DEPTH,
+            batch_size_metric=BATCH_SIZE
+        )
+        batcher.start()
+
+    shadow_model_path = os.getenv("SHADOW_MODEL_PATH")
+    if shadow_model_path:
+        try:
+            shadow_model = load_serving_model(
+                shadow_model_path, os.getenv("SHADOW_FOREST_PATH"), FLAT_FOREST_MAX_ROWS,
+                run_info_path=os.getenv("SHADOW_RUN_INFO_PATH")
+            )
+            shadow_model.warm_up()
+            shadow = ShadowScorer(
+                shadow_model,
+                sample_rate=float(os.getenv("SHADOW_SAMPLE_RATE", "0.1")),
+                queue_size=int(os.getenv("SHADOW_QUEUE_SIZE", "100")),
+                rows_metric=SHADOW_ROWS,
+                agreements_metric=SHADOW_AGREEMENTS,
+                latency_metric=SHADOW_LATENCY,
+                dropped_metric=SHADOW_DROPPED,
+                errors_metric=SHADOW_ERRORS
+            )
+            shadow.start()
+            SHADOW_INFO.labels(run_id=shadow_model.run_id or "unknown").set(1)
+            print(f"Shadow model loaded from {shadow_model_path}, sampling {shadow.sample_rate:.0%} of /predict")
+        except FileNotFoundError as e:
+            print(f"Warning: shadow model not loaded: {e}")
+
+    drift_profile_path = os.getenv("DRIFT_PROFILE_PATH", "data/processed/reference_profile.json")
+    if drift_profile_path and os.path.exists(drift_profile_path):
+        drift_monitor = DriftMonitor(
+            drift_profile_path, FEATURE_NAMES,
+            half_life_rows=float(os.getenv("DRIFT_HALF_LIFE_ROWS", "10000")),
+            min_rows=float(os.getenv("DRIFT_MIN_ROWS", "100")),
+            psi_metric=FEATURE_DRIFT_PSI,
+            ks_metric=FEATURE_DRIFT_KS,
+            class_psi_metric=PREDICTION_DRIFT_PSI,
+            rows_metric=DRIFT_WINDOW_ROWS
+        )
+
+    # Registry versions are loaded lazily on their first request, so an
+    # unreachable registry does not affect the MODEL_PATH model.
+    registry_model_name = os.getenv("MODEL_REGISTRY_NAME", "iris-classifier")
+    if registry_model_name:
+        model_versions = ModelVersionCache(
+            registry_model_name,
+            tracking_uri=os.getenv("MLFLOW_TRACKING_URI", "./mlruns"),
+            max_models=int(os.getenv("MODEL_REGISTRY_MAX_MODELS", "4")),
+            max_bytes=int(float(os.getenv("MODEL_REGISTRY_MAX_MB", "256")) * 2**20),
+            resolve_ttl=float(os.getenv("MODEL_REGISTRY_RESOLVE_TTL", "30")),
+            flat_max_rows=FLAT_FOREST_MAX_ROWS,
+            loads_metric=MODEL_VERSION_LOADS,
+            evictions_metric=MODEL_VERSION_EVICTIONS,
+            loaded_metric=MODEL_VERSIONS_LOADED,
+            bytes_metric=MODEL_VERSIONS_BYTES
+        )
+
+    watch_interval = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+    if watch_interval > 0:
+        model_watcher = asyncio.get_running_loop().create_task(_watch_model(watch_interval, stamp))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if model_watcher is not None:
+        model_watcher.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    if shadow is not None:
+        await shadow.stop()
+    if executor is not None:
+        executor.shutdown()
+
 
 @app.get("/health", response_model=HealthResponse)
 async def health():
-    start = time.time()
+    start = time.perf_counter()
+    serving_model = model
     try:
         response = HealthResponse(
-            status="healthy" if model else "degraded",
+            status="healthy" if serving_model else "degraded",
             model_version=os.getenv("MODEL_VERSION", "1.0.0"),
-            model_loaded=model is not None,
-            model_loaded_at=model_loaded_at,
+            model_loaded=serving_model is not None,
+            model_loaded_at=serving_model.loaded_at if serving_model else None,
+            model_run_id=serving_model.run_id if serving_model else None,
             timestamp=datetime.now().isoformat()
         )
-        REQUEST_COUNT.labels(endpoint="/health", method="GET", status="200").inc()
-        REQUEST_LATENCY.labels(endpoint="/health").observe(time.time() - start)
+        REQUEST_COUNT.labels(endpoint="/health", method="GET", status="200", model_version=DEFAULT_VERSION).inc()
+        REQUEST_LATENCY.labels(endpoint="/health", model_version=DEFAULT_VERSION).observe(time.perf_counter() - start)
         return response
     except Exception as e:
-        REQUEST_COUNT.labels(endpoint="/health", method="GET", status="500").inc()
+        REQUEST_COUNT.labels(endpoint="/health", method="GET", status="500", model_version=DEFAULT_VERSION).inc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/predict", response_model=PredictResponse)
-async def predict(request: PredictRequest):
-    start = time.time()
+async def _select_model(endpoint: str, ref: Optional[str]):
+    # No version reference means the MODEL_PATH model; anything else is looked
+    # up in the MLflow registry and served from the model version LRU. A cold
+    # version load is timed as its own "resolve" stage, not as decode.
+    if not ref:
+        if model is None:
+            REQUEST_COUNT.labels(endpoint=endpoint, method="POST", status="503", model_version=DEFAULT_VERSION).inc()
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        return DEFAULT_VERSION, model
     
-    if model is None:
-        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="503").inc()
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    if model_versions is None:
+        REQUEST_COUNT.labels(endpoint=endpoint, method="POST", status="404", model_version="unresolved").inc()
+        raise HTTPException(status_code=404, detail="Model registry disabled: MODEL_REGISTRY_NAME is not set")
+    start = time.perf_counter()
+    try:
+        selected = await model_versions.get(ref)
+        STAGE_TIMERS[(endpoint, "resolve")].observe(time.perf_counter() - start)
+        return selected
+    except LookupError as e:
+        REQUEST_COUNT.labels(endpoint=endpoint, method="POST", status="404", model_version="unresolved").inc()
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        REQUEST_COUNT.labels(endpoint=endpoint, method="POST", status="503", model_version="unresolved").inc()
+        raise HTTPException(status_code=503, detail=f"Model version '{ref}' could not be loaded: {e}")
+
+
+def _count_predictions(predictions: np.ndarray, version: str):
+    counters = PREDICTION_COUNTERS.get(version)
+    if counters is None:
+        counters = PREDICTION_COUNTERS[version] = [
+            PREDICTION_COUNT.labels(predicted_class=c, model_version=version) for c in IRIS_CLASSES
+        ]
+    for counter, count in zip(counters, np.bincount(predictions, minlength=len(IRIS_CLASSES))):
+        if count:
+            counter.inc(int(count))
+
+
+async def _infer_labels(serving_model: ServingModel, features: np.ndarray, endpoint: str,
+                        version: str = DEFAULT_VERSION):
+    # NaN fails every <= split and inf is accepted by the flat forest, while
+    # sklearn routes NaN to the larger child and rejects inf, so the two paths
+    # would disagree: non-finite rows are refused on every endpoint.
+    finite = np.isfinite(features).all(axis=1)
+    if not finite.all():
+        bad_rows = np.flatnonzero(~finite)
+        raise ValueError(f"Non-finite feature values in {len(bad_rows)} rows (first at row {bad_rows[0]})")
+    
+    start = time.perf_counter()
+    proba = await _predict_proba(serving_model, features)
+    predictions = serving_model.classes_.take(proba.argmax(axis=1))
+    STAGE_TIMERS[(endpoint, "inference")].observe(time.perf_counter() - start)
+    _count_predictions(predictions, version)
+    if drift_monitor is not None:
+        drift_monitor.update(features, predictions)
+    return proba, predictions
+
+
+def _json_body(model_cls) -> dict:
+    # Request schema for the OpenAPI docs of handlers that read the raw body
+    # to time its parsing themselves.
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": model_cls.model_json_schema()}}}}
+
+
+def _parse_body(body: bytes, model_cls, endpoint: str):
+    # JSON parsing and validation that FastAPI would otherwise do before the
+    # handler runs, so the decode stage sees it.
+    start = time.perf_counter()
+    request = model_cls.model_validate_json(body)
+    STAGE_TIMERS[(endpoint, "decode")].observe(time.perf_counter() - start)
+    return request
+
+
+def _encode(endpoint: str, predictions: np.ndarray, proba: np.ndarray, return_probabilities: bool,
+            response_cls=PredictResponse, **fields) -> Response:
+    # Builds and serializes the response here, rather than returning the model
+    # for FastAPI to validate and encode after the handler, so the encode stage
+    # covers the actual serialization.
+    start = time.perf_counter()
+    response = response_cls(
+        predictions=predictions.tolist(),
+        class_names=IRIS_CLASS_NAMES.take(predictions).tolist(),
+        probabilities=proba.tolist() if return_probabilities else None,
+        **fields
+    )
+    content = response.model_dump_json(exclude_none=True)
+    STAGE_TIMERS[(endpoint, "encode")].observe(time.perf_counter() - start)
+    return Response(content=content, media_type="application/json")
+
+
+async def _score(serving_model: ServingModel, features: np.ndarray, endpoint: str,
+                 version: str = DEFAULT_VERSION):
+    if features.ndim != 2 or features.shape[1] != 4:
+        raise ValueError(f"Expected 4 features, got {features.shape[-1]}")
+    
+    ROWS_OBSERVERS[endpoint].observe(len(features))
+    return await _infer_labels(serving_model, features, endpoint, version)
+
+
+async def _predict(body: bytes, model_ref: Optional[str] = None) -> Response:
+    start = time.perf_counter()
+    version, serving_model = await _select_model("/predict", model_ref)
     
     try:
+        request = _parse_body(body, PredictRequest, "/predict")
         features = np.array(request.features)
-        if features.shape[1] != 4:
-            raise ValueError(f"Expected 4 features, got {features.shape[1]}")
+        proba, predictions = await _score(serving_model, features, "/predict", version)
+        response = _encode("/predict", predictions, proba, request.return_probabilities)
         
-        predictions = model.predict(features).tolist()
-        probabilities = model.predict_proba(features).tolist()
-        class_names = [IRIS_CLASSES[p] for p in predictions]
+        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="200", model_version=version).inc()
+        REQUEST_LATENCY.labels(endpoint="/predict", model_version=version).observe(time.perf_counter() - start)
         
-        for pred in predictions:
-            PREDICTION_COUNT.labels(predicted_class=IRIS_CLASSES[pred]).inc()
+        if shadow is not None and version == DEFAULT_VERSION:
+            shadow.offer(features, predictions)
+        return response
+    except ValidationError as e:
+        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="422", model_version=version).inc()
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    except ValueError as e:
+        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="400", model_version=version).inc()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="500", model_version=version).inc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/predict", response_model=PredictResponse, response_model_exclude_none=True,
+          openapi_extra=_json_body(PredictRequest))
+async def predict(request: Request, x_model_version: Optional[str] = Header(None)):
+    return await _predict(await request.body(), x_model_version)
+
+
+async def _predict_batch(request: Request, return_probabilities: bool, model_ref: Optional[str] = None):
+    start = time.perf_counter()
+    version, serving_model = await _select_model("/predict/batch", model_ref)
+    
+    content_type = media_type(request.headers.get("content-type", ""))
+    if content_type not in CONTENT_TYPES:
+        REQUEST_COUNT.labels(endpoint="/predict/batch", method="POST", status="415", model_version=version).inc()
+        raise HTTPException(status_code=415, detail=f"Expected Content-Type one of {CONTENT_TYPES}")
+    
+    try:
+        decode_start = time.perf_counter()
+        features = decode_features(await request.body(), content_type, n_features=4)
+        STAGE_TIMERS[("/predict/batch", "decode")].observe(time.perf_counter() - decode_start)
+        proba, predictions = await _score(serving_model, features, "/predict/batch", version)
+        response = _encode("/predict/batch", predictions, proba, return_probabilities)
         
-        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="200").inc()
-        REQUEST_LATENCY.labels(endpoint="/predict").observe(time.time() - start)
+        REQUEST_COUNT.labels(endpoint="/predict/batch", method="POST", status="200", model_version=version).inc()
+        REQUEST_LATENCY.labels(endpoint="/predict/batch", model_version=version).observe(time.perf_counter() - start)
         
-        return PredictResponse(predictions=predictions, class_names=class_names, probabilities=probabilities)
+        return response
     except ValueError as e:
-        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="400").inc()
+        REQUEST_COUNT.labels(endpoint="/predict/batch", method="POST", status="400", model_version=version).inc()
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        REQUEST_COUNT.labels(endpoint="/predict", method="POST", status="500").inc()
+        REQUEST_COUNT.labels(endpoint="/predict/batch", method="POST", status="500", model_version=version).inc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/predict/batch", response_model=PredictResponse, response_model_exclude_none=True)
+async def predict_batch(request: Request, return_probabilities: bool = True,
+                        x_model_version: Optional[str] = Header(None)):
+    return await _predict_batch(request, return_probabilities, x_model_version)
+
+
+@app.post("/models/{version}/predict", response_model=PredictResponse, response_model_exclude_none=True,
+          openapi_extra=_json_body(PredictRequest))
+async def predict_version(version: str, request: Request):
+    return await _predict(await request.body(), version)
+
+
+@app.post("/models/{version}/predict/batch", response_model=PredictResponse, response_model_exclude_none=True)
+async def predict_batch_version(version: str, request: Request, return_probabilities: bool = True):
+    return await _predict_batch(request, return_probabilities, version)
+
+
+async def _stream_predictions(serving_model: ServingModel, version: str, request: Request, content_type: str,
+                              return_probabilities: bool):
+    start = time.perf_counter()
+    rows = 0
+    status = "200"
+    decode_timer = STAGE_TIMERS[("/predict/stream", "decode")]
+    encode_timer = STAGE_TIMERS[("/predict/stream", "encode")]
+    
+    try:
+        chunks = iter_feature_chunks(request.stream(), content_type, STREAM_CHUNK_ROWS, n_features=4)
+        while True:
+            decode_start = time.perf_counter()
+            try:
+                features = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            decode_timer.observe(time.perf_counter() - decode_start)
+            
+            proba, predictions = await _infer_labels(serving_model, features, "/predict/stream", version)
+            
+            encode_start = time.perf_counter()
+            names = IRIS_CLASS_NAMES.take(predictions).tolist()
+            predictions = predictions.tolist()
+            if return_probabilities:
+                lines = [json.dumps({"prediction": p, "class_name": n, "probabilities": probs})
+                         for p, n, probs in zip(predictions, names, proba.tolist())]
+            else:
+                lines = [json.dumps({"prediction": p, "class_name": n}) for p, n in zip(predictions, names)]
+            chunk = ("\n".join(lines) + "\n").encode()
+            encode_timer.observe(time.perf_counter() - encode_start)
+            
+            rows += len(predictions)
+            STREAM_ROWS.inc(len(predictions))
+            yield chunk
+    except ValueError as e:
+        status = "400"
+        yield (json.dumps({"error": str(e), "rows_scored": rows}) + "\n").encode()
+    except Exception as e:
+        status = "500"
+        yield (json.dumps({"error": str(e), "rows_scored": rows}) + "\n").encode()
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUEST_COUNT.labels(endpoint="/predict/stream", method="POST", status=status, model_version=version).inc()
+        REQUEST_LATENCY.labels(endpoint="/predict/stream", model_version=version).observe(elapsed)
+        ROWS_OBSERVERS["/predict/stream"].observe(rows)
+        if status == "200" and elapsed > 0:
+            STREAM_THROUGHPUT.set(rows / elapsed)
+
+
+@app.post("/predict/stream")
+async def predict_stream(request: Request, return_probabilities: bool = True,
+                         x_model_version: Optional[str] = Header(None)):
+    version, serving_model = await _select_model("/predict/stream", x_model_version)
+    
+    content_type = media_type(request.headers.get("content-type", ""))
+    if content_type not in STREAM_CONTENT_TYPES:
+        REQUEST_COUNT.labels(endpoint="/predict/stream", method="POST", status="415", model_version=version).inc()
+        raise HTTPException(status_code=415, detail=f"Expected Content-Type one of {STREAM_CONTENT_TYPES}")
+    
+    return DuplexStreamingResponse(
+        _stream_predictions(serving_model, version, request, content_type, return_probabilities),
+        media_type=NDJSON_CONTENT_TYPE
+    )
+
+
+def _online_features(iris_ids):
+    # feast_loader (and pandas with it) is imported on the first /predict/by-id
+    # call instead of at service import.
+    from src.features.feast_loader import get_online_feature_matrix, online_cache
+
+    online_cache.hits_metric = FEATURE_CACHE_HITS
+    online_cache.misses_metric = FEATURE_CACHE_MISSES
+    return get_online_feature_matrix(iris_ids)
+
+
+@app.post("/predict/by-id", response_model=PredictByIdResponse, response_model_exclude_none=True,
+          openapi_extra=_json_body(PredictByIdRequest))
+async def predict_by_id(request: Request, x_model_version: Optional[str] = Header(None)):
+    # Resolves features from the Feast online store (through the in-process
+    # hot-entity cache) and scores every known id in one batch. Unknown ids
+    # are reported in missing_ids rather than failing the whole request.
+    start = time.perf_counter()
+    version, serving_model = await _select_model("/predict/by-id", x_model_version)
+    
+    try:
+        body = _parse_body(await request.body(), PredictByIdRequest, "/predict/by-id")
+    except ValidationError as e:
+        REQUEST_COUNT.labels(endpoint="/predict/by-id", method="POST", status="422", model_version=version).inc()
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False, include_input=False))
+    iris_ids = np.asarray(body.iris_ids, dtype=np.int64)
+    
+    try:
+        lookup_start = time.perf_counter()
+        features = await asyncio.to_thread(_online_features, iris_ids)
+        STAGE_TIMERS[("/predict/by-id", "lookup")].observe(time.perf_counter() - lookup_start)
+    except ImportError as e:
+        REQUEST_COUNT.labels(endpoint="/predict/by-id", method="POST", status="503", model_version=version).inc()
+        raise HTTPException(status_code=503, detail=f"Feature store unavailable: {e}")
+    except Exception as e:
+        REQUEST_COUNT.labels(endpoint="/predict/by-id", method="POST", status="502", model_version=version).inc()
+        raise HTTPException(status_code=502, detail=f"Feature lookup failed: {e}")
+    
+    found = ~np.isnan(features).any(axis=1)
+    missing_ids = iris_ids[~found].tolist()
+    if missing_ids:
+        FEATURE_LOOKUP_MISSING.inc(len(missing_ids))
+    
+    try:
+        if found.any():
+            proba, predictions = await _score(serving_model, features[found], "/predict/by-id", version)
+        else:
+            proba, predictions = np.empty((0, len(IRIS_CLASSES))), np.empty(0, dtype=np.intp)
+        response = _encode("/predict/by-id", predictions, proba, body.return_probabilities,
+                           response_cls=PredictByIdResponse, iris_ids=iris_ids[found].tolist(),
+                           missing_ids=missing_ids or None)
+        
+        REQUEST_COUNT.labels(endpoint="/predict/by-id", method="POST", status="200", model_version=version).inc()
+        REQUEST_LATENCY.labels(endpoint="/predict/by-id", model_version=version).observe(time.perf_counter() - start)
+        
+        return response
+    except ValueError as e:
+        REQUEST_COUNT.labels(endpoint="/predict/by-id", method="POST", status="400", model_version=version).inc()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        REQUEST_COUNT.labels(endpoint="/predict/by-id", method="POST", status="500", model_version=version).inc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/admin/reload", response_model=ReloadResponse)
+async def admin_reload(force: bool = False, x_admin_token: Optional[str] = Header(None)):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        REQUEST_COUNT.labels(endpoint="/admin/reload", method="POST", status="404", model_version=DEFAULT_VERSION).inc()
+        raise HTTPException(status_code=404, detail="Admin API disabled: ADMIN_TOKEN is not set")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        REQUEST_COUNT.labels(endpoint="/admin/reload", method="POST", status="401", model_version=DEFAULT_VERSION).inc()
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    
+    try:
+        reloaded = await reload_model(force=force)
+    except Exception as e:
+        REQUEST_COUNT.labels(endpoint="/admin/reload", method="POST", status="500", model_version=DEFAULT_VERSION).inc()
+        raise HTTPException(status_code=500, detail=f"Reload failed, previous model kept: {e}")
+    
+    # The retrain DAG materializes features before it calls reload, so cached
+    # online rows are dropped too. feast_loader is only loaded if /predict/by-id
+    # has been called, and otherwise there is nothing to drop.
+    feast_loader = sys.modules.get("src.features.feast_loader")
+    if feast_loader is not None:
+        feast_loader.online_cache.clear()
+    
+    REQUEST_COUNT.labels(endpoint="/admin/reload", method="POST", status="200", model_version=DEFAULT_VERSION).inc()
+    return ReloadResponse(reloaded=reloaded, model_run_id=model.run_id, model_loaded_at=model.loaded_at)
+
+
 @app.get("/metrics")
 async def metrics():
+    if drift_monitor is not None:
+        drift_monitor.publish()
     return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
@@ -130,7 +714,8 @@ async def root():
     return {
         "service": "Iris Classification Service",
         "version": os.getenv("MODEL_VERSION", "1.0.0"),
-        "endpoints": ["/health", "/predict", "/metrics", "/docs"]
+        "endpoints": ["/health", "/predict", "/predict/batch", "/predict/stream", "/predict/by-id",
+                      "/models/{version}/predict", "/models/{version}/predict/batch", "/metrics", "/docs"]
     }
 
 
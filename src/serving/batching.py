@@ -0,0 +1,113 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+import numpy as np
+
+
+class MicroBatcher:
+    # Collects concurrent /predict calls into one matrix so the forest is
+    # evaluated once per window instead of once per request. Requests that
+    # arrive while a batch is being scored are picked up by the next one, so
+    # batches grow with load and a lone request is only delayed by max_wait_ms.
+    # Up to max_in_flight batches are scored concurrently (one per pool worker).
+    # Requests are grouped by the model they started on, so a batch formed
+    # across a hot reload is still scored by the right model.
+
+    def __init__(self, infer: Callable[[Any, np.ndarray], Awaitable[np.ndarray]],
+                 max_batch_rows: int = 256, max_wait_ms: float = 2.0,
+                 max_in_flight: int = 1, queue_depth_metric=None, batch_size_metric=None):
+        self.infer = infer
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max_in_flight
+        self.queue_depth_metric = queue_depth_metric
+        self.batch_size_metric = batch_size_metric
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = set()
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, serving_model, features: np.ndarray) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((features, serving_model, future))
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        pending = [await self._queue.get()]
+        rows = len(pending[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while rows < self.max_batch_rows:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            pending.append(item)
+            rows += len(item[0])
+
+        if self.queue_depth_metric is not None:
+            self.queue_depth_metric.observe(self._queue.qsize())
+        if self.batch_size_metric is not None:
+            self.batch_size_metric.observe(rows)
+        return pending
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                pending = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.get_running_loop().create_task(self._dispatch(pending))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, pending: List[tuple]):
+        try:
+            groups = {}
+            for features, serving_model, future in pending:
+                if not future.cancelled():
+                    groups.setdefault(id(serving_model), (serving_model, []))[1].append((features, future))
+            for serving_model, group in groups.values():
+                await self._score(serving_model, group)
+        finally:
+            self._slots.release()
+
+    async def _score(self, serving_model, group: List[tuple]):
+        try:
+            proba = await self.infer(serving_model, np.concatenate([f for f, _ in group]))
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for features, future in group:
+            end = offset + len(features)
+            if not future.done():
+                future.set_result(proba[offset:end])
+            offset = end
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class PredictionCache:
+    # LRU + TTL cache of probability rows keyed on the float32 bytes of each
+    # feature row. Both sklearn and FlatForest evaluate on float32, so without
+    # rounding a hit returns exactly what the model would. Entries belong to
+    # one model identity; binding a different model clears the cache.
+
+    def __init__(self, max_entries: int, ttl_seconds: float, decimals: Optional[int] = None,
+                 hits_metric=None, misses_metric=None, evictions_metric=None, size_metric=None):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.decimals = decimals
+        self.hits_metric = hits_metric
+        self.misses_metric = misses_metric
+        self.evictions_metric = evictions_metric
+        self.size_metric = size_metric
+        self.model_id = None
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bind(self, model_id: str):
+        if model_id != self.model_id:
+            self.model_id = model_id
+            self.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self._update_size()
+
+    def keys(self, features: np.ndarray) -> List[bytes]:
+        rows = np.asarray(features, dtype=np.float32)
+        if self.decimals is not None:
+            rows = rows.round(self.decimals)
+        rows = np.ascontiguousarray(rows)
+        return rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel().tolist()
+
+    def lookup(self, keys: List[bytes], n_classes: int) -> Tuple[np.ndarray, np.ndarray]:
+        now = time.monotonic()
+        proba = np.empty((len(keys), n_classes), dtype=np.float64)
+        missing = []
+
+        for i, key in enumerate(keys):
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                self._evicted("ttl")
+                entry = None
+            if entry is None:
+                missing.append(i)
+            else:
+                self._entries.move_to_end(key)
+                proba[i] = entry[1]
+
+        if self.hits_metric is not None:
+            self.hits_metric.inc(len(keys) - len(missing))
+        if self.misses_metric is not None:
+            self.misses_metric.inc(len(missing))
+        return proba, np.asarray(missing, dtype=np.intp)
+
+    def store(self, keys: List[bytes], proba: np.ndarray, model_id: Optional[str] = None):
+        if model_id is not None and model_id != self.model_id:
+            return
+        expires_at = time.monotonic() + self.ttl
+        for key, row in zip(keys, proba):
+            self._entries[key] = (expires_at, row.copy())
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evicted("capacity")
+        self._update_size()
+
+    def _evicted(self, reason: str):
+        if self.evictions_metric is not None:
+            self.evictions_metric.labels(reason=reason).inc()
+
+    def _update_size(self):
+        if self.size_metric is not None:
+            self.size_metric.set(len(self._entries))
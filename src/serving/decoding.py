@@ -0,0 +1,82 @@
+import io
+import struct
+
+import numpy as np
+
+RAW_CONTENT_TYPE = "application/octet-stream"
+NPY_CONTENT_TYPE = "application/x-npy"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+CONTENT_TYPES = (RAW_CONTENT_TYPE, NPY_CONTENT_TYPE, ARROW_CONTENT_TYPE)
+
+# Raw payload: uint32 rows, uint32 cols, then rows * cols little-endian float32.
+RAW_HEADER = struct.Struct("<II")
+
+
+def encode_raw(features: np.ndarray) -> bytes:
+    features = np.ascontiguousarray(features, dtype="<f4")
+    return RAW_HEADER.pack(*features.shape) + features.tobytes()
+
+
+def _decode_raw(body: bytes) -> np.ndarray:
+    if len(body) < RAW_HEADER.size:
+        raise ValueError("Payload is shorter than the shape header")
+    rows, cols = RAW_HEADER.unpack_from(body)
+    expected = RAW_HEADER.size + rows * cols * 4
+    if len(body) != expected:
+        raise ValueError(f"Expected {expected} bytes for shape ({rows}, {cols}), got {len(body)}")
+    return np.frombuffer(body, dtype="<f4", offset=RAW_HEADER.size).reshape(rows, cols)
+
+
+def _decode_npy(body: bytes) -> np.ndarray:
+    stream = io.BytesIO(body)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f"Unsupported .npy format version {version}")
+    if dtype.hasobject:
+        raise ValueError("Object arrays are not accepted")
+    if len(shape) != 2:
+        raise ValueError(f"Expected a 2-D array, got shape {shape}")
+
+    count = shape[0] * shape[1]
+    if len(body) - stream.tell() != count * dtype.itemsize:
+        raise ValueError(f"Payload size does not match array shape {shape}")
+    array = np.frombuffer(body, dtype=dtype, count=count, offset=stream.tell())
+    return array.reshape(shape, order="F" if fortran_order else "C")
+
+
+def _decode_arrow(body: bytes) -> np.ndarray:
+    import pyarrow as pa
+
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    if table.num_rows == 0:
+        return np.empty((0, table.num_columns), dtype=np.float32)
+    columns = [column.combine_chunks() if column.num_chunks > 1 else column.chunk(0) for column in table.columns]
+    if any(column.null_count for column in columns):
+        raise ValueError("Null feature values are not accepted")
+    return np.column_stack([column.to_numpy() for column in columns])
+
+
+def media_type(content_type: str) -> str:
+    return content_type.split(";")[0].strip().lower()
+
+
+def decode_features(body: bytes, content_type: str, n_features: int) -> np.ndarray:
+    content_type = media_type(content_type)
+    if content_type == RAW_CONTENT_TYPE:
+        features = _decode_raw(body)
+    elif content_type == NPY_CONTENT_TYPE:
+        features = _decode_npy(body)
+    elif content_type == ARROW_CONTENT_TYPE:
+        features = _decode_arrow(body)
+    else:
+        raise ValueError(f"Unsupported content type '{content_type}', expected one of {CONTENT_TYPES}")
+
+    if features.dtype.kind not in "fiu":
+        raise ValueError(f"Expected numeric features, got dtype {features.dtype}")
+    if features.shape[1] != n_features:
+        raise ValueError(f"Expected {n_features} features, got {features.shape[1]}")
+    return features
@@ -0,0 +1,90 @@
+import json
+from typing import List
+
+import numpy as np
+
+PSI_EPSILON = 1e-4
+
+
+def population_stability_index(expected: np.ndarray, actual: np.ndarray) -> float:
+    expected = np.clip(expected, PSI_EPSILON, None)
+    actual = np.clip(actual, PSI_EPSILON, None)
+    return float(((actual - expected) * np.log(actual / expected)).sum())
+
+
+def binned_ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    # Kolmogorov-Smirnov statistic on the shared bins: the largest gap
+    # between the two binned CDFs.
+    return float(np.abs(np.cumsum(actual) - np.cumsum(expected)).max())
+
+
+class DriftMonitor:
+    # Fixed-bin histograms of live inputs and predicted classes, binned on the
+    # reference profile written by prepare. Memory is one count per bin. Each
+    # batch is binned with one searchsorted per feature and a single bincount,
+    # and older counts decay with a half-life in rows, so the scores describe
+    # recent traffic rather than everything since startup.
+
+    def __init__(self, profile_path: str, feature_names: List[str], half_life_rows: float = 10000,
+                 min_rows: float = 100, psi_metric=None, ks_metric=None, class_psi_metric=None, rows_metric=None):
+        with open(profile_path, "r") as f:
+            profile = json.load(f)
+
+        self.feature_names = feature_names
+        self.edges = [np.asarray(profile["features"][name]["edges"], dtype=np.float32) for name in feature_names]
+        self.reference = [np.asarray(profile["features"][name]["proportions"]) for name in feature_names]
+        self.class_labels = np.asarray(sorted(int(label) for label in profile["classes"]))
+        self.class_reference = np.asarray([profile["classes"][str(label)] for label in self.class_labels])
+        self.half_life_rows = half_life_rows
+        self.min_rows = min_rows
+        self.psi_metric = psi_metric
+        self.ks_metric = ks_metric
+        self.class_psi_metric = class_psi_metric
+        self.rows_metric = rows_metric
+
+        sizes = [len(edges) + 1 for edges in self.edges]
+        self._offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        self._splits = np.cumsum(sizes)[:-1]
+        self._counts = np.zeros(sum(sizes))
+        self._class_counts = np.zeros(len(self.class_labels))
+        self.rows = 0.0
+
+    def update(self, features: np.ndarray, predictions: np.ndarray):
+        n = len(features)
+        if n == 0:
+            return
+        bins = np.stack([
+            np.searchsorted(edges, features[:, j], side="right") + offset
+            for j, (edges, offset) in enumerate(zip(self.edges, self._offsets))
+        ])
+        decay = 0.5 ** (n / self.half_life_rows)
+        self._counts = self._counts * decay + np.bincount(bins.ravel(), minlength=len(self._counts))
+        classes = np.searchsorted(self.class_labels, predictions)
+        self._class_counts = self._class_counts * decay + np.bincount(
+            classes[classes < len(self.class_labels)], minlength=len(self.class_labels)
+        )
+        self.rows = self.rows * decay + n
+
+    def scores(self):
+        if self.rows < self.min_rows:
+            return None
+        psi, ks = {}, {}
+        for name, reference, counts in zip(self.feature_names, self.reference, np.split(self._counts, self._splits)):
+            actual = counts / counts.sum()
+            psi[name] = population_stability_index(reference, actual)
+            ks[name] = binned_ks(reference, actual)
+        class_psi = population_stability_index(self.class_reference, self._class_counts / self._class_counts.sum())
+        return {"psi": psi, "ks": ks, "class_psi": class_psi}
+
+    def publish(self):
+        # Called on /metrics scrapes so the scores are only computed as often
+        # as Prometheus reads them.
+        if self.rows_metric is not None:
+            self.rows_metric.set(self.rows)
+        scores = self.scores()
+        if scores is None or self.psi_metric is None:
+            return
+        for name in self.feature_names:
+            self.psi_metric.labels(feature=name).set(scores["psi"][name])
+            self.ks_metric.labels(feature=name).set(scores["ks"][name])
+        self.class_psi_metric.set(scores["class_psi"])
@@ -0,0 +1,99 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+BACKENDS = ("inline", "thread", "process")
+
+_worker_model = None
+
+
+def _init_worker(model_path: str, forest_path: Optional[str], flat_max_rows: int):
+    global _worker_model
+    from src.serving.model import load_serving_model
+    if os.path.exists(model_path):
+        _worker_model = load_serving_model(model_path, forest_path, flat_max_rows)
+
+
+def _timed_call(serving_model, submitted_at: float, features: np.ndarray):
+    started_at = time.time()
+    return started_at - submitted_at, serving_model.predict_proba(features)
+
+
+def _worker_predict_proba(model_id: str, submitted_at: float, features: np.ndarray):
+    started_at = time.time()
+    if _worker_model is None or _worker_model.model_id != model_id:
+        return started_at - submitted_at, None
+    return started_at - submitted_at, _worker_model.predict_proba(features)
+
+
+class InferenceExecutor:
+    # Runs inference off the event loop so a large batch does not stall
+    # /health and /metrics. "process" workers load their own copy of the
+    # model once in the pool initializer instead of receiving it per call;
+    # reload() starts a fresh pool and lets the old one drain.
+
+    def __init__(self, backend: str = "inline", workers: Optional[int] = None,
+                 queue_wait_metric=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_wait_metric = queue_wait_metric
+        self._pool = None
+        self._pool_model_id = None
+
+    def start(self, model_path: Optional[str] = None, forest_path: Optional[str] = None,
+              flat_max_rows: int = 0, model_id: Optional[str] = None):
+        if self.backend == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        elif self.backend == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_path, forest_path, flat_max_rows)
+            )
+            self._pool_model_id = model_id
+
+    def reload(self, model_path: str, forest_path: Optional[str], flat_max_rows: int, model_id: str):
+        if self.backend != "process":
+            return
+        old_pool = self._pool
+        self.start(model_path, forest_path, flat_max_rows, model_id)
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, serving_model, features: np.ndarray) -> np.ndarray:
+        if self._pool is None:
+            return serving_model.predict_proba(features)
+
+        loop = asyncio.get_running_loop()
+        if self.backend == "process":
+            if serving_model.model_id == self._pool_model_id:
+                wait, proba = await loop.run_in_executor(
+                    self._pool, _worker_predict_proba, serving_model.model_id, time.time(), features
+                )
+                if proba is not None:
+                    self._observe_wait(wait)
+                    return proba
+            # The pool holds a different model (a request that started before a
+            # reload): finish it on the model it started with.
+            return await loop.run_in_executor(None, serving_model.predict_proba, features)
+
+        wait, proba = await loop.run_in_executor(self._pool, _timed_call, serving_model, time.time(), features)
+        self._observe_wait(wait)
+        return proba
+
+    def _observe_wait(self, wait: float):
+        if self.queue_wait_metric is not None:
+            self.queue_wait_metric.observe(max(wait, 0.0))
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from src.forest import FlatForest, file_digest, load_flat_forest
+
+FLAT_CHUNK_ROWS = 512
+
+
+class ServingModel:
+    # Everything the request path needs from one trained model, swapped as a
+    # single reference so a request never mixes artifacts of two models.
+    # With a matching flat forest the sklearn estimator (and the sklearn
+    # import behind it) is only unpickled once a batch actually needs it. If
+    # the pickle has been replaced by then (train and compact rewrite it
+    # before evaluate decides on a reload), the flat forest keeps scoring
+    # large batches in chunks instead of failing them until a reload.
+
+    def __init__(self, model_path: str, forest: Optional[FlatForest], model_id: str, run_id: Optional[str],
+                 flat_max_rows: int = 0, model=None):
+        self.model_path = model_path
+        self.forest = forest
+        self.model_id = model_id
+        self.run_id = run_id
+        self.flat_max_rows = flat_max_rows
+        self._model = model
+        self._model_lock = threading.Lock()
+        self.estimator_stale = False
+        self.classes_ = model.classes_ if model is not None else forest.classes_
+        self.loaded_at = datetime.now().isoformat()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = _load_estimator(self.model_path, self.model_id)
+        return self._model
+
+    @property
+    def model_loaded(self) -> bool:
+        return self._model is not None
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        if self.forest is not None and len(features) <= self.flat_max_rows:
+            return self.forest.predict_proba(features)
+        if not self.estimator_stale:
+            try:
+                return self.model.predict_proba(features)
+            except ModelFileChanged as e:
+                if self.forest is None:
+                    raise
+                self.estimator_stale = True
+                print(f"Warning: {e}; scoring large batches with the flat forest")
+        return self._chunked_predict_proba(features)
+
+    def _chunked_predict_proba(self, features: np.ndarray) -> np.ndarray:
+        # The flat path allocates rows x trees node indices per step, so large
+        # batches go through it in flat_max_rows-sized pieces.
+        chunk_rows = self.flat_max_rows or FLAT_CHUNK_ROWS
+        return np.concatenate([
+            self.forest.predict_proba(features[start:start + chunk_rows])
+            for start in range(0, len(features), chunk_rows)
+        ])
+
+    def warm_up(self, n_features: int = 4):
+        sample = np.zeros((1, n_features))
+        self.predict_proba(sample)
+        if self._model is not None:
+            self._model.predict_proba(sample)
+
+
+class ModelFileChanged(RuntimeError):
+    pass
+
+
+def _load_estimator(model_path: str, model_id: str):
+    import joblib
+
+    if file_digest(model_path) != model_id:
+        raise ModelFileChanged(f"{model_path} changed since the model was activated")
+    return joblib.load(model_path)
+
+
+def _load_matching_forest(forest_path: Optional[str], model_id: str) -> Optional[FlatForest]:
+    if not forest_path or not os.path.exists(forest_path):
+        return None
+
+    forest = load_flat_forest(forest_path)
+    if forest.source_digest != model_id:
+        print(f"Warning: {forest_path} was not exported from the current model, using sklearn inference")
+        return None
+    return forest
+
+
+def read_run_id(run_info_path: str) -> Optional[str]:
+    if not os.path.exists(run_info_path):
+        return None
+    with open(run_info_path, "r") as f:
+        return json.load(f).get("run_id")
+
+
+def load_serving_model(model_path: str, forest_path: Optional[str] = None, flat_max_rows: int = 0,
+                       run_info_path: Optional[str] = None, eager: bool = False) -> ServingModel:
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found at {model_path}")
+
+    model_id = file_digest(model_path)
+    forest = _load_matching_forest(forest_path, model_id)
+    model = _load_estimator(model_path, model_id) if eager or forest is None else None
+    if run_info_path is None:
+        run_info_path = os.path.join(os.path.dirname(model_path), "run_info.json")
+
+    return ServingModel(
+        model_path=model_path,
+        forest=forest,
+        model_id=model_id,
+        run_id=read_run_id(run_info_path),
+        flat_max_rows=flat_max_rows,
+        model=model
+    )
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from src.forest import flatten_forest
+from src.serving.model import ServingModel
+
+STAGES = ("none", "staging", "production", "archived")
+
+
+class ModelVersionCache:
+    # Registered versions of one MLflow model, loaded on first use and kept in
+    # an LRU bounded both by count and by approximate size. A reference is a
+    # version number, a stage ("Production"), an alias or "latest"; symbolic
+    # references are re-resolved against the registry every resolve_ttl
+    # seconds, version numbers are immutable and never are. Evicting a version
+    # only drops the cache's reference, so requests already scoring on it
+    # finish on the model they started with.
+
+    def __init__(self, model_name: str, tracking_uri: str, max_models: int = 4, max_bytes: int = 256 << 20,
+                 resolve_ttl: float = 30.0, flat_max_rows: int = 0, loads_metric=None, evictions_metric=None,
+                 loaded_metric=None, bytes_metric=None):
+        self.model_name = model_name
+        self.tracking_uri = tracking_uri
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.resolve_ttl = resolve_ttl
+        self.flat_max_rows = flat_max_rows
+        self.loads_metric = loads_metric
+        self.evictions_metric = evictions_metric
+        self.loaded_metric = loaded_metric
+        self.bytes_metric = bytes_metric
+        self._models: "OrderedDict[str, Tuple[ServingModel, int]]" = OrderedDict()
+        self._resolved: Dict[str, Tuple[str, float]] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._client = None
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+    def versions(self):
+        return list(self._models.keys())
+
+    async def get(self, ref: str) -> Tuple[str, ServingModel]:
+        version = await self.resolve(ref)
+        entry = self._models.get(version)
+        if entry is not None:
+            self._models.move_to_end(version)
+            return version, entry[0]
+
+        # Concurrent requests for a cold version share one load. The load
+        # runs as its own task, so a requester that is cancelled (a client
+        # disconnect) neither aborts it nor leaves the others waiting forever.
+        task = self._loading.get(version)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._load_version(version))
+            self._loading[version] = task
+            task.add_done_callback(lambda done: self._load_done(version, done))
+        return version, await asyncio.shield(task)
+
+    async def _load_version(self, version: str) -> ServingModel:
+        try:
+            serving_model, size = await asyncio.to_thread(self._load, version)
+        except Exception:
+            if self.loads_metric is not None:
+                self.loads_metric.labels(status="failed").inc()
+            raise
+        self._insert(version, serving_model, size)
+        return serving_model
+
+    def _load_done(self, version: str, task: asyncio.Task):
+        self._loading.pop(version, None)
+        # Mark a failure retrieved so a load whose requesters all went away
+        # does not log "exception was never retrieved".
+        if not task.cancelled():
+            task.exception()
+
+    async def resolve(self, ref: str) -> str:
+        ref = ref.strip()
+        if ref.isdigit():
+            return str(int(ref))
+        cached = self._resolved.get(ref)
+        if cached is not None and time.monotonic() - cached[1] < self.resolve_ttl:
+            return cached[0]
+        version = await asyncio.to_thread(self._resolve, ref)
+        self._resolved[ref] = (version, time.monotonic())
+        return version
+
+    def _registry(self):
+        if self._client is None:
+            from mlflow.tracking import MlflowClient
+            self._client = MlflowClient(tracking_uri=self.tracking_uri, registry_uri=self.tracking_uri)
+        return self._client
+
+    def _resolve(self, ref: str) -> str:
+        from mlflow.exceptions import MlflowException
+
+        client = self._registry()
+        try:
+            if ref.lower() == "latest":
+                versions = client.search_model_versions(f"name='{self.model_name}'")
+            elif ref.lower() in STAGES:
+                versions = client.get_latest_versions(self.model_name, stages=[ref.capitalize()])
+            else:
+                versions = [client.get_model_version_by_alias(self.model_name, ref)]
+        except MlflowException as e:
+            raise LookupError(f"Model version '{ref}' of {self.model_name} not found: {e.message}")
+        if not versions:
+            raise LookupError(f"No version of {self.model_name} matches '{ref}'")
+        return str(max(int(v.version) for v in versions))
+
+    def _load(self, version: str) -> Tuple[ServingModel, int]:
+        import mlflow.sklearn
+        from mlflow.exceptions import MlflowException
+
+        client = self._registry()
+        try:
+            model_version = client.get_model_version(self.model_name, version)
+        except MlflowException as e:
+            raise LookupError(f"Model version {version} of {self.model_name} not found: {e.message}")
+
+        mlflow.set_tracking_uri(self.tracking_uri)
+        model = mlflow.sklearn.load_model(f"models:/{self.model_name}/{version}")
+        model.set_params(n_jobs=None)
+        forest = flatten_forest(model)
+        serving_model = ServingModel(
+            model_path=model_version.source,
+            forest=forest,
+            model_id=f"{self.model_name}/{version}",
+            run_id=model_version.run_id,
+            flat_max_rows=self.flat_max_rows,
+            model=model
+        )
+        serving_model.warm_up()
+
+        # The flat arrays plus the estimator's own node arrays, which hold
+        # about the same data; a sklearn tree node is 64 bytes.
+        size = sum(getattr(forest, name).nbytes for name in ("feature", "threshold", "left", "right", "value"))
+        size += sum(e.tree_.node_count * 64 + e.tree_.value.nbytes for e in model.estimators_)
+        if self.loads_metric is not None:
+            self.loads_metric.labels(status="loaded").inc()
+        print(f"Loaded {self.model_name} version {version} (run_id={model_version.run_id}, ~{size / 2**20:.1f} MB)")
+        return serving_model, size
+
+    def _insert(self, version: str, serving_model: ServingModel, size: int):
+        self._models[version] = (serving_model, size)
+        # The version just loaded always stays, even if it alone exceeds
+        # max_bytes, so a request never evicts its own model.
+        while len(self._models) > 1 and (len(self._models) > self.max_models or self.total_bytes > self.max_bytes):
+            evicted, _ = self._models.popitem(last=False)
+            if self.evictions_metric is not None:
+                self.evictions_metric.inc()
+            print(f"Evicted {self.model_name} version {evicted} from the model cache")
+        if self.loaded_metric is not None:
+            self.loaded_metric.set(len(self._models))
+            self.bytes_metric.set(self.total_bytes)
+
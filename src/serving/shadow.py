@@ -0,0 +1,69 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+import numpy as np
+
+
+class ShadowScorer:
+    # Scores a sampled fraction of live requests with a candidate model after
+    # the primary response has been produced. Work goes through a bounded
+    # queue drained by one background task, so shadow scoring never adds to
+    # request latency: when the queue is full the sample is dropped and
+    # counted instead of waiting.
+
+    def __init__(self, shadow_model, sample_rate: float, queue_size: int = 100,
+                 rows_metric=None, agreements_metric=None, latency_metric=None,
+                 dropped_metric=None, errors_metric=None):
+        self.shadow_model = shadow_model
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.rows_metric = rows_metric
+        self.agreements_metric = agreements_metric
+        self.latency_metric = latency_metric
+        self.dropped_metric = dropped_metric
+        self.errors_metric = errors_metric
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def offer(self, features: np.ndarray, primary_predictions: np.ndarray):
+        if self._queue is None or random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((features, primary_predictions))
+        except asyncio.QueueFull:
+            if self.dropped_metric is not None:
+                self.dropped_metric.inc()
+
+    async def _run(self):
+        while True:
+            features, primary_predictions = await self._queue.get()
+            try:
+                start = time.perf_counter()
+                proba = await asyncio.to_thread(self.shadow_model.predict_proba, features)
+                if self.latency_metric is not None:
+                    self.latency_metric.observe(time.perf_counter() - start)
+
+                shadow_predictions = self.shadow_model.classes_.take(proba.argmax(axis=1))
+                if self.rows_metric is not None:
+                    self.rows_metric.inc(len(features))
+                    self.agreements_metric.inc(int((shadow_predictions == primary_predictions).sum()))
+            except Exception as e:
+                if self.errors_metric is not None:
+                    self.errors_metric.inc()
+                print(f"Warning: shadow scoring failed: {e}")
@@ -0,0 +1,85 @@
+import json
+from typing import AsyncIterator, List
+
+import numpy as np
+from fastapi.responses import StreamingResponse
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+CSV_CONTENT_TYPE = "text/csv"
+STREAM_CONTENT_TYPES = (NDJSON_CONTENT_TYPE, CSV_CONTENT_TYPE)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    # StreamingResponse polls receive() for a disconnect while streaming, which
+    # would swallow request body chunks the generator has not read yet.
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def iter_lines(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    remainder = b""
+    async for chunk in byte_stream:
+        if not chunk:
+            continue
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+    remainder = remainder.strip()
+    if remainder:
+        yield remainder
+
+
+def _parse_ndjson(lines: List[bytes]) -> np.ndarray:
+    rows = []
+    for line in lines:
+        row = json.loads(line)
+        if isinstance(row, dict):
+            if "features" not in row:
+                raise ValueError(f"NDJSON object without a \"features\" key: {line[:100].decode(errors='replace')}")
+            row = row["features"]
+        rows.append(row)
+    return np.array(rows, dtype=np.float64)
+
+
+def _parse_csv(lines: List[bytes]) -> np.ndarray:
+    return np.array([line.split(b",") for line in lines], dtype=np.float64)
+
+
+def _is_csv_header(line: bytes) -> bool:
+    try:
+        float(line.split(b",")[0])
+        return False
+    except ValueError:
+        return True
+
+
+async def iter_feature_chunks(byte_stream: AsyncIterator[bytes], content_type: str,
+                              chunk_rows: int, n_features: int) -> AsyncIterator[np.ndarray]:
+    parse = _parse_csv if content_type == CSV_CONTENT_TYPE else _parse_ndjson
+    first_line = True
+    lines = []
+
+    async for line in iter_lines(byte_stream):
+        if first_line:
+            first_line = False
+            if content_type == CSV_CONTENT_TYPE and _is_csv_header(line):
+                continue
+        lines.append(line)
+        if len(lines) >= chunk_rows:
+            yield _validated(parse(lines), n_features)
+            lines = []
+
+    if lines:
+        yield _validated(parse(lines), n_features)
+
+
+def _validated(features: np.ndarray, n_features: int) -> np.ndarray:
+    if features.ndim != 2 or features.shape[1] != n_features:
+        raise ValueError(f"Expected {n_features} features, got {features.shape[-1]}")
+    return features
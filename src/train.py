@@ -1,7 +1,10 @@
 import os
+import time
+import hashlib
 import yaml
 import json
 import joblib
+import resource
 import pandas as pd
 import mlflow
 import mlflow.sklearn
@@ -9,6 +12,10 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, f1_score
 from dotenv import load_dotenv
 
+from src.data import FEATURE_COLS, FEATURES_PATH, TRAIN_PATH, frame_digest, read_table
+from src.features.feast_loader import FEATURE_REFS, get_historical_features
+from src.forest import file_digest, flatten_forest, save_flat_forest
+
 load_dotenv()
 
 
@@ -17,37 +24,132 @@ def load_params():
         return yaml.safe_load(f)
 
 
+def join_cache_key(entity_df, feature_refs, source_path):
+    # The point-in-time join only depends on the entity rows, the requested
+    # features and the offline source file, so a hash of those three names
+    # the result.
+    key = hashlib.sha256()
+    key.update(frame_digest(entity_df).encode())
+    key.update("\n".join(feature_refs).encode())
+    key.update(file_digest(source_path).encode())
+    return key.hexdigest()
+
+
+def prune_join_cache(cache_dir, keep):
+    entries = sorted(
+        (os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".parquet")),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for path in entries[keep:]:
+        os.remove(path)
+
+
+def get_joined_features(entity_df):
+    cache_dir = os.getenv("FEAST_JOIN_CACHE_DIR", "data/cache/feast_joins")
+    if not cache_dir or not os.path.exists(FEATURES_PATH):
+        return get_historical_features(entity_df, FEATURE_REFS), "disabled"
+    
+    cache_path = os.path.join(cache_dir, f"{join_cache_key(entity_df, FEATURE_REFS, FEATURES_PATH)}.parquet")
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+        return pd.read_parquet(cache_path), "hit"
+    
+    features = get_historical_features(entity_df, FEATURE_REFS)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    features.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    prune_join_cache(cache_dir, int(os.getenv("FEAST_JOIN_CACHE_KEEP", "5")))
+    return features, "miss"
+
+
 def load_training_data():
-    train_df = pd.read_csv("data/processed/train.csv")
+    train_df = read_table(TRAIN_PATH)
+    feast_cache = "unavailable"
+    feast_join_seconds = 0.0
     
     try:
-        from feast import FeatureStore
         feast_repo_path = os.getenv("FEAST_REPO_PATH", "./feast")
         
         if os.path.exists(os.path.join(feast_repo_path, "feature_store.yaml")):
-            store = FeatureStore(repo_path=feast_repo_path)
             entity_df = train_df[["iris_id", "event_timestamp"]].copy()
             
-            features = store.get_historical_features(
-                entity_df=entity_df,
-                features=[
-                    "iris_features:sepal_length",
-                    "iris_features:sepal_width", 
-                    "iris_features:petal_length",
-                    "iris_features:petal_width"
-                ]
-            ).to_df()
+            start = time.perf_counter()
+            features, feast_cache = get_joined_features(entity_df)
+            feast_join_seconds = time.perf_counter() - start
             
             train_df = features.merge(train_df[["iris_id", "target"]], on="iris_id")
-            print("Loaded features from Feast Feature Store")
+            print(f"Loaded features from Feast Feature Store (join cache: {feast_cache}, {feast_join_seconds:.2f}s)")
     except Exception as e:
+        feast_cache = "unavailable"
         print(f"Feast not available, using local data: {e}")
     
-    return train_df
+    return train_df, feast_cache, feast_join_seconds
+
+
+def load_train_state(state_path):
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+
+def fit_forest(params, train_df, feature_cols, model_path, state):
+    # Incremental mode keeps the trees of the previous model and, via
+    # warm_start, fits `incremental_trees` new ones on rows that arrived after
+    # the last watermark. Anything that would make the old and new trees
+    # disagree (no previous model, changed depth, missing classes) falls back
+    # to a full refit. So does a constant event_timestamp: prepare stamps
+    # prepare.event_timestamp on sources without one, and a watermark on that
+    # would never see the rows added since the last run.
+    timestamps = pd.to_datetime(train_df["event_timestamp"], format="ISO8601")
+    
+    if params.get("mode", "full") == "incremental" and state and os.path.exists(model_path):
+        previous = joblib.load(model_path)
+        new_rows = train_df[timestamps > pd.Timestamp(state["watermark"])]
+        
+        if timestamps.nunique() <= 1:
+            print("Incremental training: event_timestamp is constant, so there is no watermark to train past; "
+                  "refitting from scratch")
+        elif previous.max_depth != params["max_depth"]:
+            print("Incremental training: max_depth changed, refitting from scratch")
+        elif len(new_rows) == 0:
+            print("Incremental training: no new rows since last watermark, keeping existing trees")
+            return previous, 0, "incremental"
+        elif set(new_rows["target"].unique()) != set(previous.classes_):
+            print("Incremental training: new partition does not cover all classes, refitting from scratch")
+        else:
+            previous.set_params(
+                warm_start=True,
+                n_jobs=params.get("n_jobs"),
+                n_estimators=len(previous.estimators_) + params["incremental_trees"]
+            )
+            previous.fit(new_rows[feature_cols], new_rows["target"])
+            print(f"Incremental training: added {params['incremental_trees']} trees on {len(new_rows)} new rows")
+            return previous, params["incremental_trees"], "incremental"
+    
+    model = RandomForestClassifier(
+        n_estimators=params["n_estimators"],
+        max_depth=params["max_depth"],
+        random_state=params["random_state"],
+        n_jobs=params.get("n_jobs")
+    )
+    model.fit(train_df[feature_cols], train_df["target"])
+    return model, params["n_estimators"], "full"
+
+
+def load_tuned_params(params, tuned_path="models/tuned_params.json"):
+    if not params.get("use_tuned") or not os.path.exists(tuned_path):
+        return params
+    with open(tuned_path, "r") as f:
+        tuned = json.load(f)
+    print(f"Using tuned params: n_estimators={tuned['n_estimators']}, max_depth={tuned['max_depth']}")
+    return dict(params, n_estimators=tuned["n_estimators"], max_depth=tuned["max_depth"])
 
 
 def train_model():
-    params = load_params()["train"]
+    params = load_tuned_params(load_params()["train"])
     
     mlflow_uri = os.getenv("MLFLOW_TRACKING_URI", "./mlruns")
     experiment_name = os.getenv("MLFLOW_EXPERIMENT_NAME", "iris-classification")
@@ -55,28 +157,43 @@ def train_model():
     mlflow.set_tracking_uri(mlflow_uri)
     mlflow.set_experiment(experiment_name)
     
-    train_df = load_training_data()
+    train_df, feast_cache, feast_join_seconds = load_training_data()
     
-    feature_cols = ["sepal_length", "sepal_width", "petal_length", "petal_width"]
+    feature_cols = FEATURE_COLS
     X_train = train_df[feature_cols]
     y_train = train_df["target"]
     
     with mlflow.start_run() as run:
         print(f"MLflow Run ID: {run.info.run_id}")
         
+        # Not MODEL_PATH / FLAT_FOREST_PATH: those name the compacted model the
+        # service serves and are often set through .env.
+        model_path = os.getenv("TRAIN_MODEL_PATH", "models/model.pkl")
+        state_path = "models/train_state.json"
+        
+        fit_start = time.perf_counter()
+        model, trees_fit, mode = fit_forest(params, train_df, feature_cols, model_path, load_train_state(state_path))
+        fit_seconds = time.perf_counter() - fit_start
+        # Serving evaluates the model single-threaded by default; n_jobs only
+        # applies while fitting.
+        model.set_params(n_jobs=None, warm_start=False)
+        
         mlflow.log_params({
-            "n_estimators": params["n_estimators"],
+            "n_estimators": len(model.estimators_),
             "max_depth": params["max_depth"],
             "random_state": params["random_state"],
+            "n_jobs": params.get("n_jobs"),
+            "train_mode": mode,
+            "trees_fit": trees_fit,
+            "feast_join_cache": feast_cache,
             "model_type": "RandomForestClassifier"
         })
-        
-        model = RandomForestClassifier(
-            n_estimators=params["n_estimators"],
-            max_depth=params["max_depth"],
-            random_state=params["random_state"]
-        )
-        model.fit(X_train, y_train)
+        mlflow.log_metrics({
+            "fit_seconds": fit_seconds,
+            "trees_per_second": trees_fit / fit_seconds if fit_seconds > 0 else 0.0,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "feast_join_seconds": feast_join_seconds
+        })
         
         y_pred = model.predict(X_train)
         train_accuracy = accuracy_score(y_train, y_pred)
@@ -88,9 +205,18 @@ def train_model():
         mlflow.log_dict(feature_importance, "feature_importance.json")
         
         os.makedirs("models", exist_ok=True)
-        model_path = os.getenv("MODEL_PATH", "models/model.pkl")
         joblib.dump(model, model_path)
         
+        with open(state_path, "w") as f:
+            json.dump({
+                "watermark": pd.to_datetime(train_df["event_timestamp"], format="ISO8601").max().isoformat(),
+                "n_estimators": len(model.estimators_),
+                "mode": mode
+            }, f, indent=2)
+        
+        forest_path = os.getenv("TRAIN_FOREST_PATH", "models/forest")
+        save_flat_forest(flatten_forest(model), forest_path, source_digest=file_digest(model_path))
+        
         mlflow.sklearn.log_model(model, "model", registered_model_name="iris-classifier")
         
         run_info = {
@@ -106,7 +232,9 @@ def train_model():
         print(f"\nTraining complete!")
         print(f"  - Train Accuracy: {train_accuracy:.4f}")
         print(f"  - Train F1 Score: {train_f1:.4f}")
+        print(f"  - Mode: {mode}, trees fit: {trees_fit} in {fit_seconds:.2f}s ({len(model.estimators_)} total)")
         print(f"  - Model saved to: {model_path}")
+        print(f"  - Flat forest saved to: {forest_path}")
         print(f"  - MLflow Run ID: {run.info.run_id}")
         
         return model, run_info
@@ -0,0 +1,186 @@
+import os
+import json
+import math
+import time
+import itertools
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+import numpy as np
+import mlflow
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from dotenv import load_dotenv
+
+from src.data import FEATURE_COLS, TRAIN_PATH, read_table
+from src.forest import flatten_forest
+
+load_dotenv()
+
+TUNED_PARAMS_PATH = "models/tuned_params.json"
+
+
+def load_params():
+    with open("params.yaml", "r") as f:
+        return yaml.safe_load(f)
+
+
+def measure_latency(model, row, repeats):
+    # Serving answers small requests from the flat forest, so that is what
+    # the latency term measures: median wall time of a single-row call.
+    forest = flatten_forest(model)
+    forest.predict_proba(row)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        forest.predict_proba(row)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def run_trial(config, fraction, resource, data, params):
+    X_train, y_train, X_val, y_val = data
+    n_estimators = config["n_estimators"]
+    
+    if resource == "trees":
+        n_estimators = max(1, round(n_estimators * fraction))
+    elif fraction < 1:
+        X_train, _, y_train, _ = train_test_split(
+            X_train, y_train,
+            train_size=fraction,
+            random_state=params["random_state"],
+            stratify=y_train
+        )
+    
+    start = time.perf_counter()
+    model = RandomForestClassifier(
+        n_estimators=n_estimators,
+        max_depth=config["max_depth"],
+        random_state=params["random_state"],
+        n_jobs=1
+    )
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    
+    f1 = f1_score(y_val, model.predict(X_val), average="weighted")
+    latency_ms = measure_latency(model, X_val[:1], params["latency_repeats"])
+    return {
+        "f1": f1,
+        "latency_ms": latency_ms,
+        "score": f1 - params["latency_weight"] * latency_ms,
+        "fit_seconds": fit_seconds,
+        "n_rows": len(X_train),
+        "n_trees": n_estimators
+    }
+
+
+def sample_configs(params):
+    grid = [
+        {"n_estimators": n_estimators, "max_depth": max_depth}
+        for n_estimators, max_depth in itertools.product(params["n_estimators"], params["max_depth"])
+    ]
+    rng = np.random.default_rng(params["random_state"])
+    picked = rng.choice(len(grid), size=min(params["n_candidates"], len(grid)), replace=False)
+    return [grid[i] for i in sorted(picked)]
+
+
+def successive_halving(configs, data, params, pool):
+    # Every rung multiplies the budget (rows or trees) by eta and keeps the
+    # best 1/eta of the configs, so bad ones are cut before they see the full
+    # training set.
+    eta = params["eta"]
+    n_rungs = int(math.floor(math.log(1 / params["min_fraction"], eta) + 1e-9)) + 1
+    history = {i: [] for i in range(len(configs))}
+    survivors = list(range(len(configs)))
+    
+    for rung in range(n_rungs):
+        fraction = min(1.0, params["min_fraction"] * eta ** rung) if rung < n_rungs - 1 else 1.0
+        futures = {
+            i: pool.submit(run_trial, configs[i], fraction, params["resource"], data, params)
+            for i in survivors
+        }
+        for i, future in futures.items():
+            history[i].append(dict(future.result(), rung=rung))
+        
+        print(f"  - Rung {rung}: {len(survivors)} configs at {fraction:.0%} {params['resource']}")
+        if rung < n_rungs - 1:
+            survivors.sort(key=lambda i: history[i][-1]["score"], reverse=True)
+            survivors = survivors[:max(1, math.ceil(len(survivors) / eta))]
+    
+    best = max(survivors, key=lambda i: history[i][-1]["score"])
+    return best, history
+
+
+def tune():
+    params = load_params()["tune"]
+    
+    mlflow_uri = os.getenv("MLFLOW_TRACKING_URI", "./mlruns")
+    experiment_name = os.getenv("MLFLOW_EXPERIMENT_NAME", "iris-classification")
+    
+    mlflow.set_tracking_uri(mlflow_uri)
+    mlflow.set_experiment(experiment_name)
+    
+    train_df = read_table(TRAIN_PATH, columns=FEATURE_COLS + ["target"])
+    X_train, X_val, y_train, y_val = train_test_split(
+        train_df[FEATURE_COLS].to_numpy(),
+        train_df["target"].to_numpy(),
+        test_size=params["validation_size"],
+        random_state=params["random_state"],
+        stratify=train_df["target"]
+    )
+    data = (X_train, y_train, X_val, y_val)
+    configs = sample_configs(params)
+    
+    n_jobs = params.get("n_jobs") or 1
+    workers = os.cpu_count() if n_jobs < 0 else n_jobs
+    
+    with mlflow.start_run(run_name="tune") as run:
+        print(f"MLflow Run ID: {run.info.run_id}")
+        print(f"Tuning {len(configs)} configs on {workers} workers")
+        
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            best, history = successive_halving(configs, data, params, pool)
+        tune_seconds = time.perf_counter() - start
+        
+        for i, config in enumerate(configs):
+            with mlflow.start_run(run_name=f"trial-{i}", nested=True):
+                mlflow.log_params(config)
+                mlflow.log_param("rungs", len(history[i]))
+                for result in history[i]:
+                    mlflow.log_metrics(
+                        {key: result[key] for key in ("f1", "latency_ms", "score", "fit_seconds", "n_rows", "n_trees")},
+                        step=result["rung"]
+                    )
+        
+        winner = history[best][-1]
+        mlflow.log_params({f"best_{key}": value for key, value in configs[best].items()})
+        mlflow.log_params({
+            "n_candidates": len(configs),
+            "resource": params["resource"],
+            "eta": params["eta"],
+            "latency_weight": params["latency_weight"]
+        })
+        mlflow.log_metrics({
+            "best_f1": winner["f1"],
+            "best_latency_ms": winner["latency_ms"],
+            "best_score": winner["score"],
+            "tune_seconds": tune_seconds
+        })
+    
+    tuned = dict(configs[best], f1=winner["f1"], latency_ms=winner["latency_ms"], score=winner["score"])
+    os.makedirs("models", exist_ok=True)
+    with open(TUNED_PARAMS_PATH, "w") as f:
+        json.dump(tuned, f, indent=2)
+    
+    print(f"\nTuning complete in {tune_seconds:.2f}s!")
+    print(f"  - Best params: n_estimators={tuned['n_estimators']}, max_depth={tuned['max_depth']}")
+    print(f"  - Validation F1: {tuned['f1']:.4f}, latency: {tuned['latency_ms']:.3f} ms")
+    print(f"  - Saved to: {TUNED_PARAMS_PATH}")
+    
+    return tuned
+
+
+if __name__ == "__main__":
+    tune()
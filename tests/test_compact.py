@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from src.compact import build_compact_model, node_count, prune_tree
+from src.forest import flatten_forest
+
+
+@pytest.fixture(scope="module")
+def model():
+    # Depth-limited trees on noisy labels keep impure leaves, and sibling
+    # leaves often share a majority class, so pruning has something to collapse.
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(500, 4)).astype(np.float32)
+    y = (X[:, 0] + 0.5 * rng.normal(size=500) > 0).astype(int) + (X[:, 1] > 0.8)
+    return RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0).fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def X_new():
+    return np.random.default_rng(1).normal(scale=2, size=(2000, 4)).astype(np.float32)
+
+
+def test_prune_keeps_every_tree_prediction(model, X_new):
+    compact, removed = build_compact_model(model, list(range(len(model.estimators_))), prune=True)
+
+    assert removed > 0
+    assert node_count(compact) == node_count(model) - removed
+    for original, pruned in zip(model.estimators_, compact.estimators_):
+        np.testing.assert_array_equal(pruned.predict(X_new), original.predict(X_new))
+
+
+def test_pruned_tree_is_consistent(model):
+    compact, _ = build_compact_model(model, [0], prune=False)
+    original_count = compact.estimators_[0].tree_.node_count
+    removed = prune_tree(compact.estimators_[0])
+
+    pruned = compact.estimators_[0].tree_
+    is_leaf = pruned.children_left == -1
+    assert removed > 0 and pruned.node_count == original_count - removed
+    assert np.all(pruned.children_right[is_leaf] == -1)
+    assert np.all(pruned.feature[is_leaf] == -2)
+    # Children always come after their parent, as sklearn builds them.
+    nodes = np.flatnonzero(~is_leaf)
+    assert np.all(pruned.children_left[nodes] > nodes) and np.all(pruned.children_right[nodes] > nodes)
+    assert prune_tree(compact.estimators_[0]) == 0
+
+
+def test_flat_forest_matches_pruned_subset(model, X_new):
+    compact, _ = build_compact_model(model, [3, 1, 7, 12], prune=True)
+
+    assert len(compact.estimators_) == compact.n_estimators == 4
+    np.testing.assert_allclose(flatten_forest(compact).predict_proba(X_new), compact.predict_proba(X_new), atol=1e-12)
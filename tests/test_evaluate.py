@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from sklearn.metrics import accuracy_score, confusion_matrix, f1_score, precision_score, recall_score
+
+from src.evaluate import confusion_metrics
+
+N_CLASSES = 3
+
+
+def sklearn_metrics(y_true, y_pred):
+    return {
+        "accuracy": accuracy_score(y_true, y_pred),
+        "f1_score": f1_score(y_true, y_pred, average="weighted", zero_division=0),
+        "precision": precision_score(y_true, y_pred, average="weighted", zero_division=0),
+        "recall": recall_score(y_true, y_pred, average="weighted", zero_division=0)
+    }
+
+
+def label_sets(n_sets, seed):
+    rng = np.random.default_rng(seed)
+    for i in range(n_sets):
+        n = rng.integers(1, 60)
+        y_true = rng.integers(0, N_CLASSES, size=n)
+        # Some sets never predict a class, or never contain one, to cover the
+        # zero_division=0 branches.
+        y_pred = rng.integers(0, N_CLASSES - i % 2, size=n)
+        yield y_true, y_pred
+
+
+@pytest.mark.parametrize("y_true, y_pred", list(label_sets(50, seed=0)))
+def test_confusion_metrics_match_sklearn(y_true, y_pred):
+    cm = confusion_matrix(y_true, y_pred, labels=range(N_CLASSES))
+    metrics = confusion_metrics(cm)
+    expected = sklearn_metrics(y_true, y_pred)
+
+    for name, value in expected.items():
+        assert metrics[name] == pytest.approx(value, abs=1e-12)
+
+
+def test_confusion_metrics_on_stacked_matrices():
+    pairs = list(label_sets(20, seed=1))
+    stack = np.stack([confusion_matrix(y_true, y_pred, labels=range(N_CLASSES)) for y_true, y_pred in pairs])
+    metrics = confusion_metrics(stack)
+
+    for name in ("accuracy", "f1_score", "precision", "recall"):
+        expected = [sklearn_metrics(y_true, y_pred)[name] for y_true, y_pred in pairs]
+        np.testing.assert_allclose(metrics[name], expected, atol=1e-12)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from src.forest import flatten_forest, load_flat_forest, save_flat_forest
+
+
+def fit_forest(X, y, **params):
+    model = RandomForestClassifier(n_estimators=25, random_state=0, **params)
+    return model.fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 4)).astype(np.float32)
+    y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int) + (X[:, 3] > 1)
+    return X, y
+
+
+@pytest.mark.parametrize("max_depth", [1, 3, None])
+def test_predict_proba_matches_sklearn_on_random_inputs(data, max_depth):
+    X, y = data
+    model = fit_forest(X, y, max_depth=max_depth)
+    X_new = np.random.default_rng(1).normal(scale=2, size=(1000, 4)).astype(np.float32)
+
+    np.testing.assert_allclose(flatten_forest(model).predict_proba(X_new), model.predict_proba(X_new), atol=1e-12)
+
+
+def test_predict_proba_matches_sklearn_at_split_thresholds(data):
+    # A row equal to a threshold goes left (<=). The float32 neighbours on
+    # either side must go the same way as in sklearn.
+    X, y = data
+    model = fit_forest(X, y, max_depth=6)
+    forest = flatten_forest(model)
+
+    is_split = np.concatenate([estimator.tree_.children_left != -1 for estimator in model.estimators_])
+    features = forest.feature[is_split]
+    thresholds = forest.threshold[is_split].astype(np.float32)
+    base = X[np.arange(len(features)) % len(X)]
+    rows = []
+    for value in (thresholds, np.nextafter(thresholds, np.float32(-np.inf)), np.nextafter(thresholds, np.float32(np.inf))):
+        edge = base.copy()
+        edge[np.arange(len(features)), features] = value
+        rows.append(edge)
+    X_edge = np.concatenate(rows)
+
+    np.testing.assert_allclose(forest.predict_proba(X_edge), model.predict_proba(X_edge), atol=1e-12)
+
+
+def test_predict_proba_matches_sklearn_on_tied_integer_features():
+    rng = np.random.default_rng(2)
+    X = rng.integers(0, 5, size=(300, 4)).astype(np.float32)
+    y = rng.integers(0, 3, size=300)
+    model = fit_forest(X, y)
+    X_grid = np.stack(np.meshgrid(*[np.arange(-1, 6, 0.5, dtype=np.float32)] * 4), axis=-1).reshape(-1, 4)
+
+    np.testing.assert_allclose(flatten_forest(model).predict_proba(X_grid), model.predict_proba(X_grid), atol=1e-12)
+
+
+def test_saved_forest_predicts_like_sklearn(data, tmp_path):
+    X, y = data
+    model = fit_forest(X, y, max_depth=5)
+    save_flat_forest(flatten_forest(model), str(tmp_path / "forest"))
+    forest = load_flat_forest(str(tmp_path / "forest"))
+
+    np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(X), atol=1e-12)
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+
+@pytest.mark.parametrize("value", [np.nan, np.inf, -np.inf])
+def test_service_rejects_non_finite_rows(value):
+    # The flat forest sends NaN right at every split while sklearn routes it
+    # to the larger child, so the service must refuse such rows before either
+    # path scores them.
+    import asyncio
+    from src import service
+
+    features = np.array([[5.1, 3.5, 1.4, 0.2], [5.1, 3.5, value, 0.2]], dtype=np.float32)
+    with pytest.raises(ValueError, match="Non-finite"):
+        asyncio.run(service._infer_labels(None, features, "/predict"))